@@ -24,20 +24,21 @@
 #
 
 import Queue
+from functools import partial
 import os
 import sys
-from threading import Thread
 import threading
-import time
 from urlparse import urlparse
 
-from constants import SAMPLE_RATE
+from constants import DWELL, Backpressure
 from devices import DeviceRTL, get_devices_rtl
 from events import Event, post_event, EventThread
 from file import save_plot, export_plot, ScanInfo, File
-from misc import nearest, calc_real_dwell, next_2_to_pow
-from scan import ThreadScan, anaylse_data, update_spectrum
-from settings import Settings
+from misc import nearest, calc_real_dwell, calc_samples
+from scan import ThreadScan, ThreadMerge, CaptureRing, anaylse_data, \
+    get_analysis_depth, calc_ring_slots
+from settings import Settings, Segment
+from spectrum import SpectrumStore
 
 
 class Cli(object):
@@ -49,8 +50,15 @@ class Cli(object):
         dwell = args.dwell
         nfft = args.fft
         lo = args.lo
-        index = args.index
+        rate = args.rate * 1e6
+        indexes = args.index
         remote = args.remote
+        segments = args.segment
+        adaptive = args.adaptive
+        queueSize = args.queue_size
+        backpressure = {'block': Backpressure.BLOCK,
+                        'oldest': Backpressure.OLDEST,
+                        'newest': Backpressure.NEWEST}[args.queue]
         directory, filename = os.path.split(args.file)
         _null, ext = os.path.splitext(args.file)
 
@@ -58,21 +66,45 @@ class Cli(object):
 
         self.stepsTotal = 0
         self.steps = 0
+        self.analysing = 0
+        self.analysisDepth = get_analysis_depth()
+        self.dropped = {}
+        self.late = {}
 
-        self.spectrum = {}
+        self.spectrum = SpectrumStore()
+        self.threadMerge = None
+        self.ring = None
         self.settings = Settings(load=False)
 
         self.queueNotify = Queue.Queue()
-        self.queueScan = Queue.Queue()
+        self.queueScan = Queue.Queue(max(queueSize, 1))
 
         error = None
+        errorSegment = None
 
-        if end <= start:
+        if segments is not None:
+            try:
+                segments = [self.__parse_segment(segment, dwell, nfft, rate)
+                            for segment in segments]
+                start = min([segment.start for segment in segments])
+                end = max([segment.stop for segment in segments])
+            except ValueError as parseError:
+                errorSegment = parseError.message
+
+        if errorSegment is not None:
+            error = errorSegment
+        elif end <= start:
             error = "Start should be lower than end"
         elif dwell <= 0:
             error = "Dwell should be positive"
         elif nfft <= 0:
             error = "FFT bins should be positive"
+        elif not 0.9e6 < rate <= 3.2e6:
+            error = "Sample rate should be between 0.9 and 3.2MS/s"
+        elif queueSize < 1:
+            error = "Queue size should be positive"
+        elif adaptive is not None and adaptive <= 0:
+            error = "Revisit threshold should be positive"
         elif ext != ".rfs" and File.get_type_index(ext) == -1:
             error = "File extension should be "
             error += File.get_type_pretty(File.Types.SAVE)
@@ -82,13 +114,14 @@ class Cli(object):
             if remote is None:
                 self.settings.devicesRtl = get_devices_rtl()
                 count = len(self.settings.devicesRtl)
-                if index > count - 1:
+                if max(indexes) > count - 1 or min(indexes) < 0:
                     error = "Device not found ({} devices in total):\n".format(count)
                     for device in self.settings.devicesRtl:
                         error += "\t{}: {}\n".format(device.indexRtl,
                                                      device.name)
             else:
                 device.isDevice = False
+                device.settle = DeviceRTL.SETTLE_SERVER
                 url = urlparse('//' + remote)
                 if url.hostname is not None:
                     device.server = url.hostname
@@ -99,7 +132,7 @@ class Cli(object):
                 else:
                     device.port = 1234
                 self.settings.devicesRtl.append(device)
-                index = len(self.settings.devicesRtl) - 1
+                indexes = [len(self.settings.devicesRtl) - 1]
 
         if error is not None:
             print "Error: {}".format(error)
@@ -108,28 +141,62 @@ class Cli(object):
         if end - 1 < start:
             end = start + 1
         if remote is None:
-            gain = nearest(gain, self.settings.devicesRtl[index].gains)
+            gain = nearest(gain, self.settings.devicesRtl[indexes[0]].gains)
 
         self.settings.start = start
         self.settings.stop = end
-        self.settings.dwell = calc_real_dwell(dwell)
+        self.settings.dwell = calc_real_dwell(dwell, rate)
         self.settings.scanDelay = args.delay
         self.settings.nfft = nfft
-        self.settings.devicesRtl[index].gain = gain
-        self.settings.devicesRtl[index].lo = lo
+        self.settings.indexRtl = indexes[0]
+        self.settings.queueSize = queueSize
+        self.settings.backpressure = backpressure
+        if segments is not None:
+            self.settings.segments = segments
+        if adaptive is not None:
+            self.settings.adaptive = True
+            self.settings.adaptiveLevel = adaptive
+            longSegments = self.settings.get_segments()
+            self.settings.adaptiveDwell = max([segment.dwell
+                                               for segment in longSegments])
+            self.settings.adaptiveNfft = max([segment.nfft
+                                              for segment in longSegments])
+            self.settings.dwell = calc_real_dwell(DWELL[1], rate)
+            self.settings.nfft = ThreadScan.SURVEY_NFFT
+            for segment in self.settings.segments:
+                segment.dwell = self.settings.dwell
+                segment.nfft = self.settings.nfft
+        for index in indexes:
+            self.settings.devicesRtl[index].gain = gain
+            self.settings.devicesRtl[index].lo = lo
+            self.settings.devicesRtl[index].sampleRate = rate
 
-        print "{} - {}MHz".format(start, end)
+        if segments is not None:
+            for segment in segments:
+                print "{} - {}MHz, {}s Dwell, {} FFT points".format(segment.start,
+                                                                   segment.stop,
+                                                                   segment.dwell,
+                                                                   segment.nfft)
+        else:
+            print "{} - {}MHz".format(start, end)
         print "{} Sweeps".format(sweeps)
         print "{}dB Gain".format(gain)
         print "{}s Dwell".format(self.settings.dwell)
         print "{} FFT points".format(nfft)
         print "{}MHz LO".format(lo)
+        print "{}MS/s Sample rate".format(rate / 1e6)
+        if adaptive is not None:
+            print "{}dB Revisit threshold".format(adaptive)
         if remote is not None:
             print remote
         else:
-            print self.settings.devicesRtl[index].name
+            for index in indexes:
+                print self.settings.devicesRtl[index].name
 
-        self.__scan(sweeps, self.settings, index, pool)
+        self.threadMerge = ThreadMerge(self.queueNotify, self.lock,
+                                       self.spectrum)
+        self.__scan(sweeps, self.settings, indexes, pool)
+        self.threadMerge.stop()
 
         fullName = os.path.join(directory, filename)
         if ext == ".rfs":
@@ -143,21 +210,28 @@ class Cli(object):
 
         print "Done"
 
-    def __scan(self, sweeps, settings, index, pool):
-        samples = settings.dwell * SAMPLE_RATE
-        samples = next_2_to_pow(int(samples))
-        for sweep in range(0, sweeps):
-            print '\nSweep {}:'.format(sweep + 1)
-            threadScan = ThreadScan(self.queueNotify, self.queueScan, None,
-                                    settings, index, samples, False)
-            while threadScan.isAlive() or self.steps > 0:
-                if not self.queueNotify.empty():
-                    self.__process_event(self.queueNotify, pool)
-            if self.settings.scanDelay > 0:
-                print '\nDelaying {}s'.format(self.settings.scanDelay)
-                time.sleep(self.settings.scanDelay)
-            print ""
+    def __scan(self, sweeps, settings, indexes, pool):
+        dwells = [segment.dwell for segment in settings.get_segments()]
+        if settings.adaptive:
+            dwells.append(settings.adaptiveDwell)
+        samples = max([calc_samples(dwell,
+                                    settings.devicesRtl[index].sampleRate)
+                       for dwell in dwells
+                       for index in indexes])
+        self.ring = CaptureRing(samples * 2,
+                                calc_ring_slots(settings.queueSize,
+                                                len(indexes), samples * 2))
+        threadScan = ThreadScan(self.queueNotify, self.queueScan, None,
+                                settings, indexes, False, self.ring, sweeps)
+        while threadScan.isAlive() or self.steps > 0:
+            if not self.queueNotify.empty():
+                self.__process_event(self.queueNotify, pool)
         print ""
+        for sweep in sorted(set(self.dropped) | set(self.late)):
+            print "Sweep {}: {} dropped, {} late steps".format(sweep + 1,
+                                                               self.dropped.get(sweep, 0),
+                                                               self.late.get(sweep, 0))
+        self.ring.close()
 
     def __process_event(self, queue, pool):
         event = queue.get()
@@ -167,37 +241,84 @@ class Cli(object):
 
         if status == Event.STARTING:
             print "Starting"
-        elif status == Event.STEPS:
-            self.stepsTotal = (arg1 + 1) * 2
+        elif status == Event.SWEEP_START:
+            print '\nSweep {}:'.format(arg1 + 1)
+            self.stepsTotal = self.steps + arg2 * 2
             self.steps = self.stepsTotal
+        elif status == Event.STEPS_ADD:
+            self.stepsTotal += arg1 * 2
+            self.steps += arg1 * 2
         elif status == Event.INFO:
             if arg2 != -1:
                 self.settings.devicesRtl[self.settings.indexRtl].tuner = arg2
         elif status == Event.DATA:
-            cal = self.settings.devicesRtl[self.settings.indexRtl].calibration
-            freq, scan = self.queueScan.get()
-            pool.apply_async(anaylse_data, (freq, scan, cal,
-                                            self.settings.nfft,
-                                            self.settings.overlap,
-                                            "Hamming"),
-                             callback=self.__on_process_done)
+            self.__dispatch(pool)
+        elif status == Event.DROPPED:
+            self.dropped[arg1] = self.dropped.get(arg1, 0) + 1
             self.__progress()
+            self.__progress()
+        elif status == Event.LATE:
+            self.late[arg1] = self.late.get(arg1, 0) + 1
+        elif status == Event.SWEEP_END:
+            if arg2 is not None:
+                print "\n{:.2f}MHz/s".format(arg2 / 1e6)
+        elif status == Event.DELAY_COUNT:
+            if arg1 == arg2:
+                print '\nDelaying {}s'.format(arg1)
         elif status == Event.ERROR:
             print "Error: {}".format(arg2)
             exit(1)
         elif status == Event.PROCESSED:
-            offset = self.settings.devicesRtl[self.settings.indexRtl].offset
-            Thread(target=update_spectrum, name='Update',
-                   args=(self.queueNotify, self.lock, self.settings.start,
-                         self.settings.stop, arg1,
-                         arg2, offset, self.spectrum, False,)).start()
+            self.analysing -= 1
+            self.__dispatch(pool)
+            timeStamp, scan, index, step = arg2
+            offset = self.settings.devicesRtl[index].offset
+            self.threadMerge.add(step.start, step.stop,
+                                 arg1, (timeStamp, scan), offset,
+                                 step.bandwidth, False,
+                                 replace=step.revisit)
         elif status == Event.UPDATED:
             self.__progress()
 
-    def __on_process_done(self, data):
+    def __dispatch(self, pool):
+        while self.analysing < self.analysisDepth:
+            try:
+                step, scan, index, cal = self.queueScan.get_nowait()
+            except Queue.Empty:
+                return
+            self.analysing += 1
+            pool.apply_async(anaylse_data, (step.freq, scan, cal,
+                                            step.nfft,
+                                            self.settings.overlap,
+                                            "Hamming",
+                                            self.settings.devicesRtl[index].sampleRate),
+                             callback=partial(self.__on_process_done,
+                                              capture=scan[1],
+                                              index=index, step=step))
+            self.__progress()
+
+    def __on_process_done(self, data, capture=None, index=None, step=None):
+        self.ring.release(capture)
         timeStamp, freq, scan = data
         post_event(self.queueNotify, EventThread(Event.PROCESSED, freq,
-                                                 (timeStamp, scan)))
+                                                 (timeStamp, scan, index, step)))
+
+    def __parse_segment(self, segment, dwell, nfft, rate):
+        values = segment.split(':')
+        if not 2 <= len(values) <= 4:
+            raise ValueError("Segments should be START:STOP[:DWELL[:FFT]]")
+        start = float(values[0])
+        stop = float(values[1])
+        if len(values) > 2:
+            dwell = float(values[2])
+        if len(values) > 3:
+            nfft = int(values[3])
+        if stop <= start:
+            raise ValueError("Segment start should be lower than stop")
+        if dwell <= 0 or nfft <= 0:
+            raise ValueError("Segment dwell and FFT bins should be positive")
+
+        return Segment(start, stop, calc_real_dwell(dwell, rate), nfft)
 
     def __progress(self):
         self.steps -= 1
@@ -31,7 +31,9 @@ F_MIN = 0
 F_MAX = 9999
 GAIN = 0
 SAMPLE_RATE = 2e6
-BANDWIDTH = 500e3
+SAMPLE_RATES = [1.024, 1.4, 1.8, 1.92, 2.0, 2.048, 2.4, 2.56, 2.88, 3.2]
+BANDWIDTH_USABLE = 0.8
+SETTLE_BLOCK = 512
 
 LOCATION_PORT = 7786
 
@@ -40,6 +42,10 @@ TIMESTAMP_FILE = 'version-timestamp'
 MODE = ["Single", 0,
         "Continuous", 1]
 
+BACKPRESSURE = ["Block acquisition", 0,
+                "Drop oldest", 1,
+                "Drop newest", 2]
+
 NFFT = [16,
         32,
         64,
@@ -101,6 +107,10 @@ class Mode(object):
     SINGLE, CONTIN = range(2)
 
 
+class Backpressure(object):
+    BLOCK, OLDEST, NEWEST = range(3)
+
+
 class Plot(object):
     STR_FULL = 'Full'
     STR_PARTIAL = 'Partial'
@@ -27,6 +27,8 @@ from ctypes import c_ubyte, string_at
 import rtlsdr
 import serial
 
+from constants import SAMPLE_RATE
+
 
 class DeviceGPS(object):
     NMEA_SERIAL, GPSD, GPSD_OLD, NMEA_TCP = range(4)
@@ -57,6 +59,9 @@ class DeviceGPS(object):
 
 
 class DeviceRTL(object):
+    SETTLE_DEVICE = 0.02
+    SETTLE_SERVER = 0.1
+
     def __init__(self):
         self.isDevice = True
         self.indexRtl = None
@@ -69,6 +74,12 @@ class DeviceRTL(object):
         self.calibration = 0
         self.lo = 0
         self.offset = 250e3
+        self.sampleRate = SAMPLE_RATE
+        self.settle = self.SETTLE_DEVICE
+        self.split = False
+        self.agc = False
+        self.directSampling = 0
+        self.offsetTuning = False
         self.tuner = 0
 
     def set(self, device):
@@ -76,6 +87,12 @@ class DeviceRTL(object):
         self.calibration = device.calibration
         self.lo = device.lo
         self.offset = device.offset
+        self.sampleRate = device.sampleRate
+        self.settle = device.settle
+        self.split = device.split
+        self.agc = device.agc
+        self.directSampling = device.directSampling
+        self.offsetTuning = device.offsetTuning
         self.tuner = device.tuner
 
     def get_gains_str(self):
@@ -27,21 +27,25 @@ import Queue
 import copy
 from urlparse import urlparse
 
+import rtlsdr
 from wx import grid
 import wx
 
-from constants import TUNER
+from constants import TUNER, SAMPLE_RATES
 from widgets import TickCellRenderer, SatLevel
 from devices import DeviceRTL, DeviceGPS
 from dialogs_prefs import DialogOffset
 from events import Event
 from location import ThreadLocation
 from misc import nearest, limit, get_serial_ports
+from rtltcp import RtlTcp
+from scan import calc_settle
 
 
 class DialogDevicesRTL(wx.Dialog):
     COL_SEL, COL_DEV, COL_TUN, COL_SER, COL_IND, \
-        COL_GAIN, COL_CAL, COL_LO, COL_OFF = range(9)
+        COL_GAIN, COL_RATE, COL_CAL, COL_LO, COL_OFF, COL_SET, \
+        COL_SPL = range(12)
 
     def __init__(self, parent, devices, settings):
         self.devices = copy.copy(devices)
@@ -51,7 +55,7 @@ class DialogDevicesRTL(wx.Dialog):
         wx.Dialog.__init__(self, parent=parent, title="Radio Devices")
 
         self.gridDev = grid.Grid(self)
-        self.gridDev.CreateGrid(len(self.devices), 9)
+        self.gridDev.CreateGrid(len(self.devices), 12)
         self.gridDev.SetRowLabelSize(0)
         self.gridDev.SetColLabelValue(self.COL_SEL, "Selected")
         self.gridDev.SetColLabelValue(self.COL_DEV, "Device")
@@ -59,13 +63,18 @@ class DialogDevicesRTL(wx.Dialog):
         self.gridDev.SetColLabelValue(self.COL_SER, "Serial Number")
         self.gridDev.SetColLabelValue(self.COL_IND, "Index")
         self.gridDev.SetColLabelValue(self.COL_GAIN, "Gain\n(dB)")
+        self.gridDev.SetColLabelValue(self.COL_RATE, "Sample Rate\n(MS/s)")
         self.gridDev.SetColLabelValue(self.COL_CAL, "Calibration\n(ppm)")
         self.gridDev.SetColLabelValue(self.COL_LO, "LO\n(MHz)")
         self.gridDev.SetColLabelValue(self.COL_OFF, "Band Offset\n(kHz)")
+        self.gridDev.SetColLabelValue(self.COL_SET, "Settle\n(ms)")
+        self.gridDev.SetColLabelValue(self.COL_SPL, "Split\nScan")
         self.gridDev.SetColFormatFloat(self.COL_GAIN, -1, 1)
+        self.gridDev.SetColFormatFloat(self.COL_RATE, -1, 3)
         self.gridDev.SetColFormatFloat(self.COL_CAL, -1, 3)
         self.gridDev.SetColFormatFloat(self.COL_LO, -1, 3)
         self.gridDev.SetColFormatFloat(self.COL_OFF, -1, 0)
+        self.gridDev.SetColFormatFloat(self.COL_SET, -1, 1)
 
         self.__set_dev_grid()
         self.Bind(grid.EVT_GRID_CELL_LEFT_CLICK, self.__on_click)
@@ -73,10 +82,13 @@ class DialogDevicesRTL(wx.Dialog):
         serverSizer = wx.BoxSizer(wx.HORIZONTAL)
         buttonAdd = wx.Button(self, wx.ID_ADD)
         self.buttonDel = wx.Button(self, wx.ID_DELETE)
+        self.buttonSettle = wx.Button(self, label='Measure settle')
         self.Bind(wx.EVT_BUTTON, self.__on_add, buttonAdd)
         self.Bind(wx.EVT_BUTTON, self.__on_del, self.buttonDel)
+        self.Bind(wx.EVT_BUTTON, self.__on_settle, self.buttonSettle)
         serverSizer.Add(buttonAdd, 0, wx.ALL)
         serverSizer.Add(self.buttonDel, 0, wx.ALL)
+        serverSizer.Add(self.buttonSettle, 0, wx.ALL)
         self.__set_button_state()
 
         buttonOk = wx.Button(self, wx.ID_OK)
@@ -109,16 +121,24 @@ class DialogDevicesRTL(wx.Dialog):
             self.gridDev.SetReadOnly(i, self.COL_TUN, True)
             self.gridDev.SetReadOnly(i, self.COL_SER, True)
             self.gridDev.SetReadOnly(i, self.COL_IND, True)
+            self.gridDev.SetReadOnly(i, self.COL_SPL, True)
             self.gridDev.SetCellRenderer(i, self.COL_SEL,
                                          TickCellRenderer())
+            self.gridDev.SetCellRenderer(i, self.COL_SPL,
+                                         TickCellRenderer())
             if device.isDevice:
                 cell = grid.GridCellChoiceEditor(map(str, device.gains),
                                                  allowOthers=False)
                 self.gridDev.SetCellEditor(i, self.COL_GAIN, cell)
+            cell = grid.GridCellChoiceEditor(map(str, SAMPLE_RATES),
+                                             allowOthers=False)
+            self.gridDev.SetCellEditor(i, self.COL_RATE, cell)
             self.gridDev.SetCellEditor(i, self.COL_CAL,
                                        grid.GridCellFloatEditor(-1, 3))
             self.gridDev.SetCellEditor(i, self.COL_LO,
                                        grid.GridCellFloatEditor(-1, 3))
+            self.gridDev.SetCellEditor(i, self.COL_SET,
+                                       grid.GridCellFloatEditor(-1, 1))
             if device.isDevice:
                 self.gridDev.SetCellValue(i, self.COL_DEV, device.name)
                 self.gridDev.SetCellValue(i, self.COL_SER, str(device.serial))
@@ -141,7 +161,11 @@ class DialogDevicesRTL(wx.Dialog):
             self.gridDev.SetCellValue(i, self.COL_TUN, TUNER[device.tuner])
             self.gridDev.SetCellValue(i, self.COL_CAL, str(device.calibration))
             self.gridDev.SetCellValue(i, self.COL_LO, str(device.lo))
+            self.gridDev.SetCellValue(i, self.COL_RATE,
+                                      str(device.sampleRate / 1e6))
             self.gridDev.SetCellValue(i, self.COL_OFF, str(device.offset / 1e3))
+            self.gridDev.SetCellValue(i, self.COL_SET, str(device.settle * 1e3))
+            self.gridDev.SetCellValue(i, self.COL_SPL, str(int(device.split)))
             i += 1
 
         if self.settings.indexRtl >= len(self.devices):
@@ -169,14 +193,19 @@ class DialogDevicesRTL(wx.Dialog):
             device.gain = float(self.gridDev.GetCellValue(i, self.COL_GAIN))
             device.calibration = float(self.gridDev.GetCellValue(i, self.COL_CAL))
             device.lo = float(self.gridDev.GetCellValue(i, self.COL_LO))
+            device.sampleRate = float(self.gridDev.GetCellValue(i, self.COL_RATE)) * 1e6
             device.offset = float(self.gridDev.GetCellValue(i, self.COL_OFF)) * 1e3
+            device.settle = float(self.gridDev.GetCellValue(i, self.COL_SET)) / 1e3
+            device.split = self.gridDev.GetCellValue(i, self.COL_SPL) == "1"
             i += 1
 
     def __set_button_state(self):
         if len(self.devices) > 0:
             self.buttonDel.Enable()
+            self.buttonSettle.Enable()
         else:
             self.buttonDel.Disable()
+            self.buttonSettle.Disable()
         if len(self.devices) == 1:
             self.__select_row(0)
 
@@ -205,6 +234,8 @@ class DialogDevicesRTL(wx.Dialog):
             self.__select_row(index)
         elif col == self.COL_OFF:
             device = self.devices[index]
+            device.sampleRate = float(self.gridDev.GetCellValue(index,
+                                                               self.COL_RATE)) * 1e6
             dlg = DialogOffset(self, device,
                                float(self.gridDev.GetCellValue(index,
                                                                self.COL_OFF)),
@@ -213,6 +244,12 @@ class DialogDevicesRTL(wx.Dialog):
                 self.gridDev.SetCellValue(index, self.COL_OFF,
                                           str(dlg.get_offset()))
             dlg.Destroy()
+        elif col == self.COL_SPL:
+            if self.gridDev.GetCellValue(index, self.COL_SPL) == "1":
+                tick = "0"
+            else:
+                tick = "1"
+            self.gridDev.SetCellValue(index, self.COL_SPL, tick)
         else:
             self.gridDev.ForceRefresh()
             event.Skip()
@@ -222,6 +259,7 @@ class DialogDevicesRTL(wx.Dialog):
     def __on_add(self, _event):
         device = DeviceRTL()
         device.isDevice = False
+        device.settle = DeviceRTL.SETTLE_SERVER
         self.devices.append(device)
         self.gridDev.AppendRows(1)
         self.__set_dev_grid()
@@ -235,6 +273,41 @@ class DialogDevicesRTL(wx.Dialog):
         self.SetSizerAndFit(self.devbox)
         self.__set_button_state()
 
+    def __on_settle(self, _event):
+        if self.index is None:
+            return
+
+        self.__get_dev_grid()
+        device = self.devices[self.index]
+        dlg = wx.BusyInfo('Measuring settle time, please wait...')
+
+        try:
+            if device.isDevice:
+                sdr = rtlsdr.RtlSdr(device.indexRtl)
+            else:
+                sdr = RtlTcp(device.server, device.port, None)
+            sdr.set_sample_rate(device.sampleRate)
+            sdr.set_gain(device.gain)
+            settle = calc_settle(sdr, 100e6, device.sampleRate)
+            sdr.close()
+        except IOError as error:
+            if device.isDevice:
+                message = error.message
+            else:
+                message = error
+            dlg.Destroy()
+            dlg = wx.MessageDialog(self,
+                                   'Measurement failed:\n{}'.format(message),
+                                   'Error',
+                                   wx.OK | wx.ICON_ERROR)
+            dlg.ShowModal()
+            dlg.Destroy()
+            return
+
+        dlg.Destroy()
+        self.gridDev.SetCellValue(self.index, self.COL_SET,
+                                  str(round(settle * 1e3, 1)))
+
     def __on_ok(self, _event):
         self.__get_dev_grid()
         if self.__warn_duplicates():
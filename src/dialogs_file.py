@@ -24,6 +24,7 @@
 #
 
 import Queue
+from collections import OrderedDict
 import cPickle
 import os
 
@@ -319,7 +320,7 @@ class DialogExportSeq(wx.Dialog):
     POLL = 250
 
     def __init__(self, parent, spectrum, settings):
-        self.spectrum = spectrum
+        self.spectrum = sort_spectrum(spectrum)
         self.settings = settings
         self.sweeps = None
         self.isExporting = False
@@ -497,13 +498,12 @@ class DialogExportSeq(wx.Dialog):
         try:
             count = 1
             for timeStamp, sweep in self.sweeps.items():
-                name = '{0:.0f}.png'.format(timeStamp)
+                name = '{:.6f}.png'.format(timeStamp)
                 directory = self.editDir.GetValue()
                 filename = os.path.join(directory, name)
 
                 thread = self.plot.set_plot({timeStamp: sweep}, extent, False)
                 thread.join()
-                filename = os.path.join(directory, '{}.png'.format(timeStamp))
                 export_image(filename, File.ImageType.PNG,
                              self.figure,
                              self.settings)
@@ -519,12 +519,10 @@ class DialogExportSeq(wx.Dialog):
             self.EndModal(wx.ID_OK)
 
     def __spectrum_range(self, start, end):
-        sweeps = {}
+        self.sweeps = OrderedDict()
         for timeStamp, sweep in self.spectrum.items():
             if start <= timeStamp <= end:
-                sweeps[timeStamp] = sweep
-
-        self.sweeps = sort_spectrum(sweeps)
+                self.sweeps[timeStamp] = sweep
 
     def __draw_plot(self):
         start, end = self.__get_range()
@@ -33,9 +33,11 @@ import wx
 from wx.lib.agw.cubecolourdialog import CubeColourDialog
 from wx.lib.masked.numctrl import NumCtrl
 
-from constants import F_MIN, F_MAX, SAMPLE_RATE, BANDWIDTH, WINFUNC
+from constants import F_MIN, F_MAX, WINFUNC, DWELL, NFFT, BACKPRESSURE
 from panels import PanelColourBar
+from misc import calc_bandwidth
 from rtltcp import RtlTcp
+from scan import calc_settle_bytes
 from utils_mpl import get_colours
 
 
@@ -73,7 +75,8 @@ class DialogOffset(wx.Dialog):
 
         textOffset = wx.StaticText(self, label="Offset (kHz)")
         self.spinOffset = wx.SpinCtrl(self)
-        self.spinOffset.SetRange(0, ((SAMPLE_RATE / 2) - BANDWIDTH) / 1e3)
+        edge = calc_bandwidth(device.sampleRate, 0) / 2
+        self.spinOffset.SetRange(0, (edge - device.sampleRate / 20) / 1e3)
         self.spinOffset.SetValue(offset)
         self.Bind(wx.EVT_SPINCTRL, self.__on_spin, self.spinOffset)
 
@@ -132,7 +135,7 @@ class DialogOffset(wx.Dialog):
         function = WINFUNC[1::2][pos]
         powers, freqs = matplotlib.mlab.psd(capture,
                                             NFFT=1024,
-                                            Fs=SAMPLE_RATE / 1e6,
+                                            Fs=self.device.sampleRate / 1e6,
                                             window=function(1024))
 
         plot = []
@@ -154,9 +157,11 @@ class DialogOffset(wx.Dialog):
                 sdr = rtlsdr.RtlSdr(self.device.indexRtl)
             else:
                 sdr = RtlTcp(self.device.server, self.device.port, None)
-            sdr.set_sample_rate(SAMPLE_RATE)
+            sdr.set_sample_rate(self.device.sampleRate)
             sdr.set_center_freq(self.spinFreq.GetValue() * 1e6)
             sdr.set_gain(self.spinGain.GetValue())
+            sdr.read_bytes(calc_settle_bytes(self.device.settle,
+                                             self.device.sampleRate))
             capture = sdr.read_samples(2 ** 21)
             sdr.close()
         except IOError as error:
@@ -183,7 +188,8 @@ class DialogOffset(wx.Dialog):
 
     def __draw_limits(self):
         limit1 = self.offset
-        limit2 = limit1 + BANDWIDTH / 2
+        limit2 = limit1 + calc_bandwidth(self.device.sampleRate,
+                                         self.offset) / 2
         limit1 /= 1e6
         limit2 /= 1e6
         if self.band1 is not None:
@@ -271,6 +277,15 @@ class DialogPrefs(wx.Dialog):
         self.spinCtrlMaxScans.SetValue(settings.retainMax)
         self.spinCtrlMaxScans.SetToolTipString('Maximum previous scans'
                                                ' to display')
+        self.checkMemory = wx.CheckBox(self, wx.ID_ANY, "Limit memory (MB)")
+        self.checkMemory.SetValue(settings.retainByMemory)
+        self.checkMemory.SetToolTipString('Retain as many scans as fit'
+                                          ' instead')
+        self.Bind(wx.EVT_CHECKBOX, self.__on_radio, self.checkMemory)
+        self.spinMemory = wx.SpinCtrl(self)
+        self.spinMemory.SetRange(1, 65536)
+        self.spinMemory.SetValue(settings.retainMemory)
+        self.spinMemory.SetToolTipString('Memory for previous scans')
 
         textWidth = wx.StaticText(self, label="Line width")
         self.ctrlWidth = NumCtrl(self, integerWidth=2, fractionWidth=1)
@@ -311,6 +326,9 @@ class DialogPrefs(wx.Dialog):
         congrid.Add(textMaxScans, pos=(2, 0),
                     flag=wx.ALIGN_CENTRE_VERTICAL)
         congrid.Add(self.spinCtrlMaxScans, pos=(2, 1))
+        congrid.Add(self.checkMemory, pos=(3, 0),
+                    flag=wx.ALIGN_CENTRE_VERTICAL)
+        congrid.Add(self.spinMemory, pos=(3, 1))
         conbox = wx.StaticBoxSizer(wx.StaticBox(self, wx.ID_ANY,
                                                 "Continuous Scans"),
                                    wx.VERTICAL)
@@ -355,7 +373,10 @@ class DialogPrefs(wx.Dialog):
 
     def __on_radio(self, _event):
         enabled = self.radioRetain.GetValue()
-        self.spinCtrlMaxScans.Enable(enabled)
+        memory = self.checkMemory.GetValue()
+        self.spinCtrlMaxScans.Enable(enabled and not memory)
+        self.checkMemory.Enable(enabled)
+        self.spinMemory.Enable(enabled and memory)
 
     def __on_choice(self, _event):
         self.colourBar.set_map(self.choiceColour.GetStringSelection())
@@ -373,6 +394,8 @@ class DialogPrefs(wx.Dialog):
         self.settings.retainScans = self.radioRetain.GetValue()
         self.settings.lineWidth = self.ctrlWidth.GetValue()
         self.settings.retainMax = self.spinCtrlMaxScans.GetValue()
+        self.settings.retainByMemory = self.checkMemory.GetValue()
+        self.settings.retainMemory = self.spinMemory.GetValue()
         self.settings.colourMap = self.choiceColour.GetStringSelection()
         self.settings.background = self.background
 
@@ -398,6 +421,38 @@ class DialogAdvPrefs(wx.Dialog):
         self.buttonWindow = wx.Button(self, wx.ID_ANY, self.winFunc)
         self.Bind(wx.EVT_BUTTON, self.__on_window, self.buttonWindow)
 
+        self.checkAdaptive = wx.CheckBox(self, wx.ID_ANY,
+                                         "Revisit active channels")
+        self.checkAdaptive.SetValue(settings.adaptive)
+        self.checkAdaptive.SetToolTipString('Survey the range quickly then'
+                                            ' rescan steps above the noise'
+                                            ' floor')
+        self.Bind(wx.EVT_CHECKBOX, self.__on_adaptive, self.checkAdaptive)
+        textLevel = wx.StaticText(self, label='Threshold (dB)')
+        self.spinLevel = wx.SpinCtrl(self, wx.ID_ANY, min=1, max=60)
+        self.spinLevel.SetValue(settings.adaptiveLevel)
+        self.spinLevel.SetToolTipString('Level above the noise floor to'
+                                        ' revisit')
+        textDwell = wx.StaticText(self, label='Revisit dwell')
+        self.choiceDwell = wx.Choice(self, choices=DWELL[::2])
+        try:
+            sel = DWELL[1::2].index(settings.adaptiveDwell)
+        except ValueError:
+            sel = len(DWELL) / 4
+        self.choiceDwell.SetSelection(sel)
+        textNfft = wx.StaticText(self, label='Revisit FFT size')
+        self.choiceNfft = wx.Choice(self, choices=map(str, NFFT))
+        self.choiceNfft.SetSelection(NFFT.index(settings.adaptiveNfft))
+
+        textQueue = wx.StaticText(self, label='Capture queue')
+        self.spinQueue = wx.SpinCtrl(self, wx.ID_ANY, min=1, max=256)
+        self.spinQueue.SetValue(settings.queueSize)
+        self.spinQueue.SetToolTipString('Captures waiting for analysis')
+        textBack = wx.StaticText(self, label='When full')
+        self.choiceBack = wx.Choice(self, choices=BACKPRESSURE[::2])
+        self.choiceBack.SetSelection(BACKPRESSURE[1::2].index(settings.backpressure))
+        self.choiceBack.SetToolTipString('Action when analysis falls behind')
+
         buttonOk = wx.Button(self, wx.ID_OK)
         buttonCancel = wx.Button(self, wx.ID_CANCEL)
         sizerButtons = wx.StdDialogButtonSizer()
@@ -412,12 +467,33 @@ class DialogAdvPrefs(wx.Dialog):
         advgrid.Add(self.slideOverlap, pos=(0, 1), flag=wx.EXPAND)
         advgrid.Add(textWindow, pos=(1, 0), flag=wx.EXPAND)
         advgrid.Add(self.buttonWindow, pos=(1, 1))
-        advgrid.Add(sizerButtons, pos=(2, 1), flag=wx.EXPAND)
+        advgrid.Add(self.checkAdaptive, pos=(2, 0), span=(1, 2))
+        advgrid.Add(textLevel, pos=(3, 0), flag=wx.EXPAND)
+        advgrid.Add(self.spinLevel, pos=(3, 1))
+        advgrid.Add(textDwell, pos=(4, 0), flag=wx.EXPAND)
+        advgrid.Add(self.choiceDwell, pos=(4, 1))
+        advgrid.Add(textNfft, pos=(5, 0), flag=wx.EXPAND)
+        advgrid.Add(self.choiceNfft, pos=(5, 1))
+        advgrid.Add(textQueue, pos=(6, 0), flag=wx.EXPAND)
+        advgrid.Add(self.spinQueue, pos=(6, 1))
+        advgrid.Add(textBack, pos=(7, 0), flag=wx.EXPAND)
+        advgrid.Add(self.choiceBack, pos=(7, 1))
+        advgrid.Add(sizerButtons, pos=(8, 1), flag=wx.EXPAND)
 
         advBox = wx.BoxSizer()
         advBox.Add(advgrid, flag=wx.ALL | wx.ALIGN_CENTRE, border=10)
 
         self.SetSizerAndFit(advBox)
+        self.__set_adaptive()
+
+    def __on_adaptive(self, _event):
+        self.__set_adaptive()
+
+    def __set_adaptive(self):
+        enabled = self.checkAdaptive.GetValue()
+        self.spinLevel.Enable(enabled)
+        self.choiceDwell.Enable(enabled)
+        self.choiceNfft.Enable(enabled)
 
     def __on_window(self, _event):
         dlg = DialogWinFunc(self, self.winFunc)
@@ -429,6 +505,12 @@ class DialogAdvPrefs(wx.Dialog):
     def __on_ok(self, _event):
         self.settings.overlap = self.slideOverlap.GetValue() / 100.0
         self.settings.winFunc = self.winFunc
+        self.settings.adaptive = self.checkAdaptive.GetValue()
+        self.settings.adaptiveLevel = self.spinLevel.GetValue()
+        self.settings.adaptiveDwell = DWELL[1::2][self.choiceDwell.GetSelection()]
+        self.settings.adaptiveNfft = NFFT[self.choiceNfft.GetSelection()]
+        self.settings.queueSize = self.spinQueue.GetValue()
+        self.settings.backpressure = BACKPRESSURE[1::2][self.choiceBack.GetSelection()]
 
         self.EndModal(wx.ID_OK)
 
@@ -23,8 +23,15 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
 
+import math
+
+from wx import grid
 import wx
 
+from constants import F_MIN, F_MAX, DWELL, NFFT
+from misc import calc_real_dwell
+from settings import Segment
+
 
 class DialogScanDelay(wx.Dialog):
     def __init__(self, parent, settings):
@@ -58,6 +65,123 @@ class DialogScanDelay(wx.Dialog):
         self.EndModal(wx.ID_OK)
 
 
+class DialogSegments(wx.Dialog):
+    COL_START, COL_STOP, COL_DWELL, COL_NFFT = range(4)
+
+    def __init__(self, parent, settings):
+        wx.Dialog.__init__(self, parent=parent, title='Scan Segments')
+
+        self.settings = settings
+
+        textHelp = wx.StaticText(self,
+                                 label='Segments replace the start and stop '
+                                 'frequencies when scanning.\n'
+                                 'Leave the list empty to scan a single range.')
+
+        self.gridSeg = grid.Grid(self)
+        self.gridSeg.CreateGrid(0, 4)
+        self.gridSeg.SetRowLabelSize(0)
+        self.gridSeg.SetColLabelValue(self.COL_START, "Start\n(MHz)")
+        self.gridSeg.SetColLabelValue(self.COL_STOP, "Stop\n(MHz)")
+        self.gridSeg.SetColLabelValue(self.COL_DWELL, "Dwell")
+        self.gridSeg.SetColLabelValue(self.COL_NFFT, "FFT Size")
+        self.gridSeg.SetColFormatFloat(self.COL_START, -1, 3)
+        self.gridSeg.SetColFormatFloat(self.COL_STOP, -1, 3)
+        for segment in settings.segments:
+            self.__add_row(segment)
+
+        buttonAdd = wx.Button(self, wx.ID_ADD)
+        buttonDel = wx.Button(self, wx.ID_DELETE)
+        self.Bind(wx.EVT_BUTTON, self.__on_add, buttonAdd)
+        self.Bind(wx.EVT_BUTTON, self.__on_del, buttonDel)
+        sizerEdit = wx.BoxSizer(wx.HORIZONTAL)
+        sizerEdit.Add(buttonAdd, 0, wx.ALL)
+        sizerEdit.Add(buttonDel, 0, wx.ALL)
+
+        sizerButtons = wx.StdDialogButtonSizer()
+        buttonOk = wx.Button(self, wx.ID_OK)
+        buttonCancel = wx.Button(self, wx.ID_CANCEL)
+        sizerButtons.AddButton(buttonOk)
+        sizerButtons.AddButton(buttonCancel)
+        sizerButtons.Realize()
+        self.Bind(wx.EVT_BUTTON, self.__on_ok, buttonOk)
+
+        self.sizer = wx.BoxSizer(wx.VERTICAL)
+        self.sizer.Add(textHelp, flag=wx.ALL, border=5)
+        self.sizer.Add(self.gridSeg, 1, flag=wx.ALL | wx.EXPAND, border=5)
+        self.sizer.Add(sizerEdit, flag=wx.ALL, border=5)
+        self.sizer.Add(sizerButtons, flag=wx.ALL, border=5)
+
+        self.SetSizerAndFit(self.sizer)
+
+    def __add_row(self, segment):
+        row = self.gridSeg.GetNumberRows()
+        self.gridSeg.AppendRows(1)
+        self.gridSeg.SetCellEditor(row, self.COL_START,
+                                   grid.GridCellFloatEditor(-1, 3))
+        self.gridSeg.SetCellEditor(row, self.COL_STOP,
+                                   grid.GridCellFloatEditor(-1, 3))
+        self.gridSeg.SetCellEditor(row, self.COL_DWELL,
+                                   grid.GridCellChoiceEditor(DWELL[::2],
+                                                             allowOthers=False))
+        self.gridSeg.SetCellEditor(row, self.COL_NFFT,
+                                   grid.GridCellChoiceEditor(map(str, NFFT),
+                                                             allowOthers=False))
+        dwell = calc_real_dwell(segment.dwell)
+        try:
+            label = DWELL[DWELL.index(dwell) - 1]
+        except ValueError:
+            label = DWELL[::2][len(DWELL) / 4]
+        self.gridSeg.SetCellValue(row, self.COL_START, str(segment.start))
+        self.gridSeg.SetCellValue(row, self.COL_STOP, str(segment.stop))
+        self.gridSeg.SetCellValue(row, self.COL_DWELL, label)
+        self.gridSeg.SetCellValue(row, self.COL_NFFT, str(segment.nfft))
+
+    def __on_add(self, _event):
+        rows = self.gridSeg.GetNumberRows()
+        if rows:
+            start = float(self.gridSeg.GetCellValue(rows - 1, self.COL_STOP))
+        else:
+            start = self.settings.start
+        self.__add_row(Segment(start, start + 1,
+                               self.settings.dwell, self.settings.nfft))
+        self.SetSizerAndFit(self.sizer)
+
+    def __on_del(self, _event):
+        rows = self.gridSeg.GetSelectedRows()
+        if not rows:
+            rows = [self.gridSeg.GetGridCursorRow()]
+        for row in sorted(rows, reverse=True):
+            if 0 <= row < self.gridSeg.GetNumberRows():
+                self.gridSeg.DeleteRows(row)
+        self.SetSizerAndFit(self.sizer)
+
+    def __on_ok(self, _event):
+        segments = []
+        for row in range(self.gridSeg.GetNumberRows()):
+            start = float(self.gridSeg.GetCellValue(row, self.COL_START))
+            stop = float(self.gridSeg.GetCellValue(row, self.COL_STOP))
+            label = self.gridSeg.GetCellValue(row, self.COL_DWELL)
+            dwell = DWELL[DWELL.index(label) + 1]
+            nfft = int(self.gridSeg.GetCellValue(row, self.COL_NFFT))
+            if not F_MIN <= start < stop <= F_MAX:
+                wx.MessageBox('Segment {} should have a start lower than its '
+                              'stop, within {}-{}MHz'.format(row + 1,
+                                                             F_MIN, F_MAX),
+                              'Warning', wx.OK | wx.ICON_WARNING)
+                return
+            segments.append(Segment(start, stop, dwell, nfft))
+
+        segments.sort(key=lambda s: s.start)
+        self.settings.segments = segments
+        if segments:
+            self.settings.start = int(math.floor(segments[0].start))
+            self.settings.stop = int(math.ceil(max([segment.stop
+                                                    for segment in segments])))
+
+        self.EndModal(wx.ID_OK)
+
+
 if __name__ == '__main__':
     print 'Please run rtlsdr_scan.py'
     exit(1)
@@ -0,0 +1,101 @@
+#
+# rtlsdr_scan
+#
+# http://eartoearoak.com/software/rtlsdr-scanner
+#
+# Copyright 2012 - 2015 Al Brown
+#
+# A frequency scanning GUI for the OsmoSDR rtl-sdr library at
+# http://sdr.osmocom.org/trac/wiki/rtl-sdr
+#
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, or (at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import numpy
+from numpy.lib.stride_tricks import as_strided
+
+from constants import WINFUNC
+
+
+__windows = {}
+__blockSamples = 65536
+__levels = (numpy.arange(256, dtype=numpy.float32) - 127.5) / 127.5
+
+
+def raw_to_iq(raw):
+    raw = numpy.frombuffer(raw, numpy.uint8)
+    iq = numpy.take(__levels, raw[:len(raw) & ~1])
+
+    return iq.view(numpy.complex64)
+
+
+def get_window(nfft, winFunc):
+    key = (nfft, winFunc)
+    if key not in __windows:
+        pos = WINFUNC[::2].index(winFunc)
+        function = WINFUNC[1::2][pos]
+        window = function(nfft)
+        __windows[key] = (window, (numpy.abs(window) ** 2).sum())
+
+    return __windows[key]
+
+
+def segment(samples, nfft, noverlap):
+    if len(samples) < nfft:
+        padded = numpy.zeros(nfft, samples.dtype)
+        padded[:len(samples)] = samples
+        samples = padded
+
+    step = nfft - noverlap
+    count = (len(samples) - noverlap) // step
+    stride = samples.strides[0]
+
+    return as_strided(samples, shape=(count, nfft),
+                      strides=(step * stride, stride))
+
+
+def psd(samples, nfft, overlap, winFunc, fs):
+    samples = numpy.ascontiguousarray(samples)
+    window, windowPower = get_window(nfft, winFunc)
+    segments = segment(samples, nfft, int(nfft * overlap))
+
+    rows = max(1, __blockSamples // nfft)
+    powers = numpy.zeros(nfft)
+    for start in xrange(0, len(segments), rows):
+        spectrum = numpy.fft.fft(segments[start:start + rows] * window,
+                                 axis=1)
+        powers += (spectrum.real ** 2 + spectrum.imag ** 2).sum(axis=0)
+    powers /= len(segments) * fs * windowPower
+
+    powers = numpy.fft.fftshift(powers).astype(numpy.float32)
+    freqs = numpy.fft.fftshift(numpy.fft.fftfreq(nfft, 1. / fs))
+
+    return powers, freqs.astype(numpy.float32)
+
+
+def psd_freqs(record):
+    freqStart, freqStep, cal, powers = record
+    nfft = len(powers)
+    rate = round(freqStep * nfft * 1e6)
+    first = round(freqStart * 1e6 * nfft / rate)
+    bins = first + numpy.arange(nfft)
+    freqs = bins * rate / nfft / 1e6
+
+    return freqs + freqs * cal / 1e6
+
+
+if __name__ == '__main__':
+    print 'Please run rtlsdr_scan.py'
+    exit(1)
@@ -24,6 +24,7 @@
 #
 
 import Queue
+import threading
 import time
 
 import wx
@@ -33,11 +34,11 @@ EVENT_THREAD = wx.NewId()
 
 
 class Event(object):
-    STARTING, STEPS, INFO, DATA, STOPPED, ERROR, FINISHED, PROCESSED, \
-        CAL, LEVEL, UPDATED, DRAW, \
-        DELAY_COUNT, DELAY_START, \
+    STARTING, SWEEP_START, SWEEP_END, STEPS_ADD, INFO, DATA, DROPPED, \
+        LATE, STOPPED, ERROR, FINISHED, PROCESSED, CAL, LEVEL, UPDATED, \
+        DRAW, DELAY_COUNT, BATCH, \
         VER_UPD, VER_NOUPD, VER_UPDFAIL, \
-        LOC, LOC_RAW, LOC_WARN, LOC_ERR, LOC_SAT = range(22)
+        LOC, LOC_RAW, LOC_WARN, LOC_ERR, LOC_SAT = range(26)
 
 
 class Status(object):
@@ -63,28 +64,35 @@ class EventThread(wx.PyEvent):
         self.data = Status(status, arg1, arg2)
 
 
-class EventTimer(wx.Timer):
-    def __init__(self, parent, delay,
-                 eventCount=Event.DELAY_COUNT, eventStart=Event.DELAY_START):
-        wx.Timer.__init__(self)
-        self.parent = parent
-        self.delay = delay
-        self.count = delay
-        self.eventCount = eventCount
-        self.eventStart = eventStart
+class EventBatch(threading.Thread):
+    INTERVAL = 0.05
 
-        self.Start(1000)
-        post_event(parent,
-                   EventThread(self.eventCount, self.delay, self.count))
+    def __init__(self, destination, interval=INTERVAL):
+        threading.Thread.__init__(self)
+        self.name = 'Batch'
+        self.daemon = True
+        self.destination = destination
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.pending = threading.Event()
+        self.statuses = []
 
-    def Notify(self):
-        self.count -= 1
-        post_event(self.parent,
-                   EventThread(self.eventCount, self.delay, self.count))
-        if self.count == 0:
-            self.Stop()
-            post_event(self.parent,
-                       EventThread(self.eventStart))
+        self.start()
+
+    def run(self):
+        while True:
+            self.pending.wait()
+            time.sleep(self.interval)
+            with self.lock:
+                statuses = self.statuses
+                self.statuses = []
+                self.pending.clear()
+            post_event(self.destination, EventThread(Event.BATCH, statuses))
+
+    def add(self, status):
+        with self.lock:
+            self.statuses.append(status)
+            self.pending.set()
 
 
 class Log(object):
@@ -120,6 +128,8 @@ class Log(object):
 def post_event(destination, status):
     if isinstance(destination, Queue.Queue):
         destination.put(status)
+    elif isinstance(destination, EventBatch):
+        destination.add(status.data)
     elif isinstance(destination, wx.EvtHandler):
         wx.PostEvent(destination, status)
 
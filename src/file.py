@@ -43,7 +43,7 @@ import wx
 
 from constants import APP_NAME
 from misc import format_iso_time
-from spectrum import sort_spectrum, create_mesh
+from spectrum import sort_spectrum, create_mesh, SpectrumStore
 
 
 class File(object):
@@ -376,6 +376,9 @@ def open_plot(dirname, filename):
 
 
 def save_plot(filename, scanInfo, spectrum, location):
+    if isinstance(spectrum, SpectrumStore):
+        spectrum = spectrum.as_dict()
+
     data = [File.HEADER, {'Version': File.VERSION,
                           'Start': scanInfo.start,
                           'Stop': scanInfo.stop,
@@ -449,7 +452,7 @@ def export_csv(handle, spectrum):
     handle.write(u"Time (UTC), Frequency (MHz),Level (dB/Hz)\n")
     for plot in spectrum.iteritems():
         for freq, pwr in plot[1].iteritems():
-            handle.write("{}, {}, {}\n".format(plot[0], freq, pwr))
+            handle.write("{:.6f}, {}, {}\n".format(plot[0], freq, pwr))
 
 
 def export_plt(handle, spectrum):
@@ -459,7 +462,7 @@ def export_plt(handle, spectrum):
     handle.write('set zlabel "Level (dB/Hz)"\n')
     handle.write('set ydata time\n')
     handle.write('set timefmt "%s"\n')
-    handle.write('set format y "%H:%M:%S"\n')
+    handle.write('set format y "%H:%M:%.3S"\n')
     handle.write('set pm3d\n')
     handle.write('set hidden3d\n')
     handle.write('set palette rgb 33,13,10\n')
@@ -467,7 +470,7 @@ def export_plt(handle, spectrum):
     for plot in spectrum.iteritems():
         handle.write('\n')
         for freq, pwr in plot[1].iteritems():
-            handle.write("{} {} {}\n".format(freq, plot[0], pwr))
+            handle.write("{} {:.6f} {}\n".format(freq, plot[0], pwr))
 
 
 def export_freemat(handle, spectrum):
@@ -24,11 +24,11 @@
 #
 
 import Queue
-from collections import OrderedDict
+from collections import OrderedDict, deque
+from functools import partial
 import math
 import os.path
 import tempfile
-import thread
 from threading import Thread
 import threading
 import time
@@ -45,10 +45,11 @@ from dialogs_file import DialogImageSize, DialogExportSeq, DialogExportGeo, \
     DialogProperties, DialogSaveWarn, DialogRestore
 from dialogs_help import DialogSysInfo, DialogAbout
 from dialogs_prefs import DialogPrefs, DialogAdvPrefs, DialogFormatting
-from dialogs_scan import DialogScanDelay
+from dialogs_scan import DialogScanDelay, DialogSegments
 from dialogs_tools import DialogCompare, DialogAutoCal, DialogSats, DialogSmooth, \
     DialogLog
-from events import EVENT_THREAD, Event, EventThread, post_event, Log, EventTimer
+from events import EVENT_THREAD, Event, EventThread, EventBatch, post_event, \
+    Log
 from file import save_plot, export_plot, open_plot, ScanInfo, export_image, \
     export_map, extension_add, File, run_file, export_gpx, Backups
 from location import ThreadLocation, LocationServer
@@ -57,9 +58,10 @@ from misc import RemoteControl, calc_samples, calc_real_dwell, \
     get_version_timestamp, get_version_timestamp_repo, format_iso_time, limit
 from panels import PanelGraph
 from printer import PrintOut
-from scan import ThreadScan, anaylse_data, update_spectrum
+from scan import ThreadScan, ThreadMerge, CaptureRing, anaylse_data, \
+    get_scan_devices, get_analysis_depth, calc_ring_slots
 from settings import Settings
-from spectrum import count_points, sort_spectrum, Extent
+from spectrum import sort_spectrum, Extent, SpectrumStore
 from toolbars import Statusbar, NavigationToolbar
 from utils_google import create_gearth
 from utils_mpl import add_colours
@@ -100,10 +102,14 @@ class FrameMain(wx.Frame):
 
         self.sdr = None
         self.threadScan = None
+        self.threadMerge = None
         self.threadUpdate = None
         self.threadLocation = None
 
         self.queueScan = Queue.Queue()
+        self.ring = None
+        self.analysing = 0
+        self.analysisDepth = get_analysis_depth()
 
         self.serverLocation = None
 
@@ -113,8 +119,6 @@ class FrameMain(wx.Frame):
         self.stopAtEnd = False
         self.stopScan = False
 
-        self.scanDelayTimer = None
-
         self.dlgCal = None
         self.dlgSats = None
         self.dlgLog = None
@@ -136,7 +140,7 @@ class FrameMain(wx.Frame):
         self.spinCtrlStop = None
         self.choiceDisplay = None
 
-        self.spectrum = OrderedDict()
+        self.spectrum = SpectrumStore()
         self.scanInfo = ScanInfo()
         self.locations = OrderedDict()
         self.lastLocation = [None] * 4
@@ -192,8 +196,19 @@ class FrameMain(wx.Frame):
 
         self.SetIcon(load_icon('rtlsdr_scan'))
 
-        self.steps = 0
+        self.sweep = 0
+        self.sweepSteps = {}
+        self.sweepRate = None
+        self.dropped = {}
+        self.late = {}
         self.stepsTotal = 0
+        self.merging = deque()
+
+        self.batch = EventBatch(self)
+        self.redraw = False
+        self.progress = None
+
+        self.threadMerge = ThreadMerge(self.batch, self.lock, self.spectrum)
 
         self.__start_gps()
         self.__start_location_server()
@@ -322,6 +337,7 @@ class FrameMain(wx.Frame):
         self.Bind(wx.EVT_MENU, self.__on_stop, self.menuMain.stop)
         self.Bind(wx.EVT_MENU, self.__on_stop_end, self.menuMain.stopEnd)
         self.Bind(wx.EVT_MENU, self.__on_scan_delay, self.menuMain.sweepDelay)
+        self.Bind(wx.EVT_MENU, self.__on_segments, self.menuMain.segments)
         self.Bind(wx.EVT_MENU, self.__on_compare, self.menuMain.compare)
         self.Bind(wx.EVT_MENU, self.__on_smooth, self.menuMain.smooth)
         self.Bind(wx.EVT_MENU, self.__on_cal, self.menuMain.cal)
@@ -377,8 +393,9 @@ class FrameMain(wx.Frame):
     def __on_new(self, _event):
         if self.__save_warn(Warn.NEW):
             return True
-        self.spectrum.clear()
-        self.locations.clear()
+        with self.lock:
+            self.spectrum.clear()
+            self.locations.clear()
         self.__saved(True)
         self.__set_plot(self.spectrum, False)
         self.graph.clear_selection()
@@ -416,10 +433,11 @@ class FrameMain(wx.Frame):
                 return
             data = dlg.get_restored()
             self.scanInfo, spectrum, locations = data
-            self.spectrum.clear()
-            self.locations.clear()
-            self.spectrum.update(OrderedDict(sorted(spectrum.items())))
-            self.locations.update(OrderedDict(sorted(locations.items())))
+            with self.lock:
+                self.spectrum.clear()
+                self.locations.clear()
+                self.spectrum.update(OrderedDict(sorted(spectrum.items())))
+                self.locations.update(OrderedDict(sorted(locations.items())))
             self.__set_plot(self.spectrum, self.settings.annotate)
             self.graph.scale_plot(True)
             self.status.set_general("Finished")
@@ -495,7 +513,9 @@ class FrameMain(wx.Frame):
         dlgFile.Destroy()
 
     def __on_export_image_seq(self, _event):
-        dlgSeq = DialogExportSeq(self, self.spectrum, self.settings)
+        with self.lock:
+            spectrum = sort_spectrum(self.spectrum)
+        dlgSeq = DialogExportSeq(self, spectrum, self.settings)
         dlgSeq.ShowModal()
         dlgSeq.Destroy()
 
@@ -586,6 +606,9 @@ class FrameMain(wx.Frame):
             self.Bind(wx.EVT_CLOSE, self.__on_exit)
             return
         self.__scan_stop(False)
+        self.threadMerge.stop()
+        if self.ring is not None:
+            self.ring.close()
         self.__stop_gps(False)
         self.__stop_location_server()
         self.__get_controls()
@@ -655,14 +678,17 @@ class FrameMain(wx.Frame):
         dlg.Show()
 
     def __on_smooth(self, _event):
-        dlg = DialogSmooth(self, self.spectrum, self.settings)
+        with self.lock:
+            spectrum = sort_spectrum(self.spectrum)
+        dlg = DialogSmooth(self, spectrum, self.settings)
         if dlg.ShowModal() == wx.ID_OK:
             saved = self.isSaved
             self.isSaved = False
             if not self.__on_new(None):
-                self.spectrum.clear()
                 spectrum = dlg.get_spectrum()
-                self.spectrum.update(OrderedDict(sorted(spectrum.items())))
+                with self.lock:
+                    self.spectrum.clear()
+                    self.spectrum.update(OrderedDict(sorted(spectrum.items())))
                 self.__set_plot(self.spectrum, False)
                 self.graph.update_measure()
                 self.graph.redraw_plot()
@@ -780,16 +806,22 @@ class FrameMain(wx.Frame):
             self.__scan_stop()
         else:
             self.stopScan = False
-            self.stopAtEnd = True
+            self.__stop_at_end()
 
     def __on_stop_end(self, _event):
-        self.stopAtEnd = True
+        self.__stop_at_end()
 
     def __on_scan_delay(self, _event):
         dlg = DialogScanDelay(self, self.settings)
         dlg.ShowModal()
         dlg.Destroy()
 
+    def __on_segments(self, _event):
+        dlg = DialogSegments(self, self.settings)
+        if dlg.ShowModal() == wx.ID_OK:
+            self.__set_controls()
+        dlg.Destroy()
+
     def __on_range_lim(self, _event):
         xmin, xmax = self.graph.get_axes().get_xlim()
         xmin = int(xmin)
@@ -810,17 +842,47 @@ class FrameMain(wx.Frame):
         self.__start_gps()
 
     def __on_event(self, event):
-        status = event.data.get_status()
-        arg1 = event.data.get_arg1()
-        arg2 = event.data.get_arg2()
+        if event.data.get_status() == Event.BATCH:
+            for status in event.data.get_arg1():
+                self.__on_status(status)
+        else:
+            self.__on_status(event.data)
+
+        if self.progress is not None:
+            self.status.set_progress(self.progress)
+            self.status.show_progress()
+            self.progress = None
+        if self.redraw:
+            self.redraw = False
+            self.__set_plot(self.spectrum,
+                            self.settings.annotate and
+                            self.settings.retainScans and
+                            self.settings.mode == Mode.CONTIN)
+
+        wx.YieldIfNeeded()
+
+    def __on_status(self, data):
+        status = data.get_status()
+        arg1 = data.get_arg1()
+        arg2 = data.get_arg2()
         if status == Event.STARTING:
             self.status.set_general("Starting")
             self.isScanning = True
-        elif status == Event.STEPS:
-            self.stepsTotal = (arg1 + 1) * 2
-            self.steps = self.stepsTotal
+        elif status == Event.SWEEP_START:
+            if arg1 > 0:
+                self.__limit_spectrum()
+            self.sweep = arg1
+            self.stepsTotal = arg2 * 2
+            self.sweepSteps[arg1] = self.stepsTotal
+            self.progress = None
+            self.status.set_general("Scanning ({} sweeps)".format(len(self.spectrum)))
             self.status.set_progress(0)
             self.status.show_progress()
+        elif status == Event.STEPS_ADD:
+            if arg2 in self.sweepSteps:
+                self.sweepSteps[arg2] += arg1 * 2
+            if arg2 == self.sweep:
+                self.stepsTotal += arg1 * 2
         elif status == Event.CAL:
             self.__auto_cal(Cal.DONE)
         elif status == Event.INFO:
@@ -831,20 +893,25 @@ class FrameMain(wx.Frame):
                     self.scanInfo.tuner = arg2
         elif status == Event.DATA:
             self.__saved(False)
-            cal = self.devicesRtl[self.settings.indexRtl].calibration
-            freq, scan = self.queueScan.get()
-            self.pool.apply_async(anaylse_data,
-                                  (freq, scan, cal,
-                                   self.settings.nfft,
-                                   self.settings.overlap,
-                                   self.settings.winFunc),
-                                  callback=self.__on_process_done)
-            self.__progress()
+            self.__dispatch()
+        elif status == Event.DROPPED:
+            self.dropped[arg1] = self.dropped.get(arg1, 0) + 1
+            self.__progress(arg1)
+            self.__progress(arg1)
+        elif status == Event.LATE:
+            self.late[arg1] = self.late.get(arg1, 0) + 1
         elif status == Event.STOPPED:
             self.__cleanup()
             self.status.set_general("Stopped")
+        elif status == Event.SWEEP_END:
+            self.sweepRate = arg2
+            if arg2 is not None:
+                self.status.set_info("Sweep rate: {:.2f} MHz/s".format(arg2 / 1e6),
+                                     level=None)
         elif status == Event.FINISHED:
             self.threadScan = None
+            if not self.sweepSteps:
+                self.__scan_done()
         elif status == Event.ERROR:
             self.__cleanup()
             self.status.set_general("Error: {}".format(arg2), level=Log.ERROR)
@@ -852,32 +919,27 @@ class FrameMain(wx.Frame):
                 self.dlgCal.Destroy()
                 self.dlgCal = None
         elif status == Event.PROCESSED:
-            offset = self.settings.devicesRtl[self.settings.indexRtl].offset
+            self.analysing -= 1
+            self.__dispatch()
+            timeStamp, scan, index, step = arg2
+            offset = self.settings.devicesRtl[index].offset
             if self.settings.alert:
                 alert = self.settings.alertLevel
             else:
                 alert = None
-            try:
-                Thread(target=update_spectrum, name='Update',
-                       args=(self, self.lock, self.settings.start,
-                             self.settings.stop, arg1,
-                             arg2, offset, self.spectrum,
-                             not self.settings.retainScans,
-                             alert)).start()
-            except thread.error:
-                self.__cleanup()
-                self.__scan_stop(False)
-                wx.MessageBox('Out of memory', 'Error',
-                              wx.OK | wx.ICON_ERROR)
+            self.merging.append(step.sweep)
+            self.threadMerge.add(step.start, step.stop,
+                                 arg1, (timeStamp, scan), offset,
+                                 step.bandwidth,
+                                 not self.settings.retainScans, alert,
+                                 step.revisit)
         elif status == Event.LEVEL:
             wx.Bell()
         elif status == Event.UPDATED:
             if arg2 and self.settings.liveUpdate:
-                self.__set_plot(self.spectrum,
-                                self.settings.annotate and
-                                self.settings.retainScans and
-                                self.settings.mode == Mode.CONTIN)
-            self.__progress()
+                self.redraw = True
+            if self.merging:
+                self.__progress(self.merging.popleft())
         elif status == Event.DRAW:
             self.graph.draw()
         elif status == Event.DELAY_COUNT:
@@ -885,9 +947,6 @@ class FrameMain(wx.Frame):
             progress = (float(arg1 - arg2) / arg1) * 100.
             self.status.set_progress(progress)
             self.status.show_progress()
-        elif status == Event.DELAY_START:
-            self.status.hide_progress()
-            self.__scan_start()
         elif status == Event.VER_UPD:
             self.__update_checked(True, arg1, arg2)
         elif status == Event.VER_NOUPD:
@@ -910,12 +969,11 @@ class FrameMain(wx.Frame):
             if self.dlgSats is not None:
                 self.dlgSats.set_sats(arg2)
 
-        wx.YieldIfNeeded()
-
-    def __on_process_done(self, data):
+    def __on_process_done(self, data, capture=None, index=None, step=None):
+        self.ring.release(capture)
         timeStamp, freq, scan = data
-        post_event(self, EventThread(Event.PROCESSED, freq,
-                                     (timeStamp, scan)))
+        post_event(self.batch, EventThread(Event.PROCESSED, freq,
+                                     (timeStamp, scan, index, step)))
 
     def __auto_cal(self, status):
         freq = self.dlgCal.get_arg1()
@@ -926,8 +984,9 @@ class FrameMain(wx.Frame):
                 self.oldCal = self.devicesRtl[self.settings.indexRtl].calibration
                 self.devicesRtl[self.settings.indexRtl].calibration = 0
                 self.__get_controls()
-                self.spectrum.clear()
-                self.locations.clear()
+                with self.lock:
+                    self.spectrum.clear()
+                    self.locations.clear()
                 if not self.__scan_start(isCal=True):
                     self.dlgCal.reset_cal()
             elif status == Cal.DONE:
@@ -954,27 +1013,37 @@ class FrameMain(wx.Frame):
 
         return ((freq - peak) / freq) * 1e6
 
-    def __scan_delay(self):
-        if self.settings.scanDelay == 0:
-            self.__scan_start()
-        else:
-            if self.scanDelayTimer is not None:
-                self.scanDelayTimer.Stop()
-            self.scanDelayTimer = EventTimer(self, self.settings.scanDelay)
-
     def __scan_start(self, isCal=False):
         if self.isNewScan and self.__save_warn(Warn.SCAN):
             return False
 
         if not self.threadScan:
-            if self.scanDelayTimer is not None:
-                self.scanDelayTimer.Stop()
-                self.scanDelayTimer = None
             self.__set_control_state(False)
-            samples = calc_samples(self.settings.dwell)
+            if isCal:
+                devices = [self.settings.indexRtl]
+            else:
+                devices = get_scan_devices(self.devicesRtl,
+                                           self.settings.indexRtl)
+            dwells = [segment.dwell
+                      for segment in self.settings.get_segments(isCal)]
+            if self.settings.adaptive and not isCal:
+                dwells.append(self.settings.adaptiveDwell)
+            samples = max([calc_samples(dwell,
+                                        self.devicesRtl[device].sampleRate)
+                           for dwell in dwells
+                           for device in devices])
+            slots = calc_ring_slots(self.settings.queueSize, len(devices),
+                                    samples * 2)
+            self.__drain_scan()
+            if (self.ring is None or self.ring.get_size() != samples * 2 or
+                    self.ring.get_slots() != slots):
+                if self.ring is not None:
+                    self.ring.close()
+                self.ring = CaptureRing(samples * 2, slots)
             if self.isNewScan:
-                self.spectrum.clear()
-                self.locations.clear()
+                with self.lock:
+                    self.spectrum.clear()
+                    self.locations.clear()
                 self.graph.clear_plots()
 
                 self.isNewScan = False
@@ -985,10 +1054,19 @@ class FrameMain(wx.Frame):
                 self.scanInfo.lon = None
                 self.scanInfo.desc = ''
 
+            self.__set_retention()
             self.stopAtEnd = False
             self.stopScan = False
-            self.threadScan = ThreadScan(self, self.queueScan, self.sdr, self.settings,
-                                         self.settings.indexRtl, samples, isCal)
+            self.sweepSteps.clear()
+            self.dropped.clear()
+            self.late.clear()
+            self.queueScan = Queue.Queue(self.settings.queueSize)
+            if self.settings.mode == Mode.CONTIN and not isCal:
+                sweeps = None
+            else:
+                sweeps = 1
+            self.threadScan = ThreadScan(self.batch, self.queueScan, self.sdr, self.settings,
+                                         devices, isCal, self.ring, sweeps)
             self.filename = "Scan {0:.1f}-{1:.1f}MHz".format(self.settings.start,
                                                              self.settings.stop)
             self.graph.set_plot_title()
@@ -1008,60 +1086,105 @@ class FrameMain(wx.Frame):
             self.sdr.close()
         self.__set_control_state(True)
 
-    def __progress(self):
-        if self.steps == self.stepsTotal:
-            self.status.set_general("Scanning ({} sweeps)".format(len(self.spectrum)))
-        self.steps -= 1
-        if self.steps > 0 and not self.stopScan:
-            self.status.set_progress((self.stepsTotal - self.steps) * 100.0
-                                     / (self.stepsTotal - 1))
-            self.status.show_progress()
+    def __stop_at_end(self):
+        self.stopAtEnd = True
+        if self.threadScan is not None:
+            self.threadScan.stop_at_end()
+
+    def __drain_scan(self):
+        while True:
+            try:
+                _step, scan, _index, _cal = self.queueScan.get_nowait()
+            except Queue.Empty:
+                return
+            if self.ring is not None:
+                self.ring.release(scan[1])
+
+    def __dispatch(self):
+        while self.analysing < self.analysisDepth:
+            try:
+                step, scan, index, cal = self.queueScan.get_nowait()
+            except Queue.Empty:
+                return
+            self.analysing += 1
+            self.pool.apply_async(anaylse_data,
+                                  (step.freq, scan, cal,
+                                   step.nfft,
+                                   self.settings.overlap,
+                                   self.settings.winFunc,
+                                   self.devicesRtl[index].sampleRate),
+                                  callback=partial(self.__on_process_done,
+                                                   capture=scan[1],
+                                                   index=index, step=step))
+            self.__progress(step.sweep)
+
+    def __progress(self, sweep):
+        if sweep not in self.sweepSteps:
+            return
+        self.sweepSteps[sweep] -= 1
+        steps = self.sweepSteps[sweep]
+        if steps > 0 and not self.stopScan:
+            if sweep == self.sweep:
+                self.progress = ((self.stepsTotal - steps) * 100.0
+                                 / (self.stepsTotal - 1))
         else:
+            del self.sweepSteps[sweep]
+            self.__show_losses(sweep)
             if self.settings.backup:
                 self.backups.save(self.scanInfo, self.spectrum, self.locations)
-            self.status.hide_progress()
             self.__set_plot(self.spectrum, self.settings.annotate)
             if self.stopScan:
                 self.status.set_general("Stopped")
                 self.__cleanup()
-            elif self.settings.mode == Mode.SINGLE:
-                self.status.set_general("Finished")
-                self.__cleanup()
-            else:
-                if self.settings.mode == Mode.CONTIN:
-                    if self.dlgCal is None and not self.stopAtEnd:
-                        self.__limit_spectrum()
-                        self.__scan_delay()
-                    else:
-                        self.status.set_general("Stopped")
-                        self.__cleanup()
+            elif self.threadScan is None and not self.sweepSteps:
+                self.__scan_done()
+
+    def __show_losses(self, sweep):
+        dropped = self.dropped.pop(sweep, 0)
+        late = self.late.pop(sweep, 0)
+        if dropped or late:
+            text = "Sweep {}: {} dropped, {} late steps".format(sweep + 1,
+                                                                 dropped,
+                                                                 late)
+            if self.sweepRate is not None:
+                text = "Sweep rate: {:.2f} MHz/s, ".format(self.sweepRate / 1e6) + text
+            self.status.set_info(text, level=Log.WARN)
+
+    def __scan_done(self):
+        if self.settings.mode == Mode.SINGLE or self.dlgCal is not None:
+            self.status.set_general("Finished")
+        else:
+            self.status.set_general("Stopped")
+        self.__cleanup()
 
     def __cleanup(self):
-        if self.scanDelayTimer is not None:
-            self.scanDelayTimer.Stop()
-            self.scanDelayTimer = None
-
         if self.sdr is not None:
             self.sdr.close()
             self.sdr = None
 
         self.status.hide_progress()
-        self.steps = 0
+        self.progress = None
+        self.sweepSteps.clear()
         self.threadScan = None
         self.__set_control_state(True)
         self.stopAtEnd = False
         self.stopScan = True
         self.isScanning = False
 
-    def __remove_last(self, data):
-        while len(data) >= self.settings.retainMax:
-            timeStamp = min(data)
-            del data[timeStamp]
-
     def __limit_spectrum(self):
         with self.lock:
-            self.__remove_last(self.spectrum)
-            self.__remove_last(self.locations)
+            oldest = self.spectrum.get_oldest()
+            while len(self.locations) and next(iter(self.locations)) < oldest:
+                self.locations.popitem(last=False)
+
+    def __set_retention(self):
+        with self.lock:
+            if self.settings.mode != Mode.CONTIN:
+                self.spectrum.set_capacity()
+            elif self.settings.retainByMemory:
+                self.spectrum.set_capacity(memory=self.settings.retainMemory * 1e6)
+            else:
+                self.spectrum.set_capacity(self.settings.retainMax)
 
     def __start_gps(self):
         if self.settings.gps and len(self.settings.devicesGps):
@@ -1123,10 +1246,10 @@ class FrameMain(wx.Frame):
 
     def __set_plot(self, spectrum, annotate):
         if len(spectrum) > 0:
-            total = count_points(spectrum)
-            if total > 0:
+            with self.lock:
                 spectrum = sort_spectrum(spectrum)
-                extent = Extent(spectrum)
+            extent = Extent(spectrum)
+            if extent.is_valid():
                 self.graph.set_plot(spectrum,
                                     self.settings.pointsLimit,
                                     self.settings.pointsMax,
@@ -1279,10 +1402,11 @@ class FrameMain(wx.Frame):
         _scanInfo, spectrum, locations = open_plot(dirname, filename)
 
         if len(spectrum) > 0:
-            self.spectrum.clear()
-            self.locations.clear()
-            self.spectrum.update(OrderedDict(sorted(spectrum.items())))
-            self.locations.update(OrderedDict(sorted(locations.items())))
+            with self.lock:
+                self.spectrum.clear()
+                self.locations.clear()
+                self.spectrum.update(OrderedDict(sorted(spectrum.items())))
+                self.locations.update(OrderedDict(sorted(locations.items())))
             self.__set_plot(self.spectrum, self.settings.annotate)
             self.graph.scale_plot(True)
             self.status.set_general("Finished")
@@ -1308,13 +1432,15 @@ class FrameMain(wx.Frame):
 
         if len(spectrum) > 0:
             self.scanInfo.set_to_settings(self.settings)
-            self.spectrum = spectrum
-            self.locations.clear()
-            self.locations.update(location)
+            with self.lock:
+                self.spectrum.clear()
+                self.spectrum.update(spectrum)
+                self.locations.clear()
+                self.locations.update(location)
             self.__saved(True)
             self.__set_controls()
             self.__set_control_state(True)
-            self.__set_plot(spectrum, self.settings.annotate)
+            self.__set_plot(self.spectrum, self.settings.annotate)
             self.graph.scale_plot(True)
             self.status.set_general("Finished")
             self.settings.fileHistory.AddFileToHistory(os.path.join(dirname,
@@ -108,6 +108,8 @@ class MenuMain(object):
         scan.AppendSeparator()
         self.sweepDelay = scan.Append(wx.ID_ANY, "Delay...",
                                       "Delay between sweeps")
+        self.segments = scan.Append(wx.ID_ANY, "Se&gments...",
+                                    "Scan a list of frequency segments")
 
         tools = wx.Menu()
         self.compare = tools.Append(wx.ID_ANY, "&Compare...",
@@ -174,6 +176,7 @@ class MenuMain(object):
         self.advPref.Enable(state)
         self.devicesRtl.Enable(state)
         self.devicesGps.Enable(state)
+        self.segments.Enable(state)
         self.reset.Enable(state)
         self.smooth.Enable(state)
         self.cal.Enable(state)
@@ -36,7 +36,7 @@ import urllib
 
 import serial.tools.list_ports
 
-from constants import SAMPLE_RATE, TIMESTAMP_FILE
+from constants import SAMPLE_RATE, BANDWIDTH_USABLE, TIMESTAMP_FILE
 
 
 class RemoteControl(object):
@@ -113,18 +113,27 @@ def next_2_to_pow(val):
     return val + 1
 
 
-def calc_samples(dwell):
-    samples = dwell * SAMPLE_RATE
+def calc_samples(dwell, rate=SAMPLE_RATE):
+    samples = dwell * rate
     samples = next_2_to_pow(int(samples))
     return samples
 
 
-def calc_real_dwell(dwell):
-    samples = calc_samples(dwell)
-    dwellReal = samples / SAMPLE_RATE
+def calc_real_dwell(dwell, rate=SAMPLE_RATE):
+    samples = calc_samples(dwell, rate)
+    dwellReal = samples / rate
     return (int)(dwellReal * 1000.0) / 1000.0
 
 
+def calc_bandwidth(rate, offset, nfft=None):
+    edge = rate / 2 * BANDWIDTH_USABLE
+    half = max(edge - offset, rate / 20)
+    if nfft is not None:
+        binWidth = float(rate) / nfft
+        half = max(int(half / binWidth), 1) * binWidth
+    return half * 2
+
+
 def nearest(value, values):
     offset = [abs(value - v) for v in values]
     return values[offset.index(min(offset))]
@@ -352,7 +352,10 @@ class PanelGraph(wx.Panel):
                                            self.selectEnd)
 
             if isLimited:
-                self.spectrum = reduce_points(spectrum, limit)
+                pixels = self.plot.get_axes().get_window_extent().width
+                self.spectrum = reduce_points(spectrum, limit,
+                                              max(1, int(pixels)),
+                                              self.extent)
 
             self.status.set_busy(True)
             self.plot.set_plot(self.spectrum, self.extent, annotate)
@@ -79,9 +79,27 @@ def __arguments():
     parser.add_argument("-f", "--fft", help="FFT bins", type=int, default=1024)
     parser.add_argument("-l", "--lo", help="Local oscillator offset",
                         type=int,default=0)
+    parser.add_argument("-a", "--rate", help="Sample rate (MS/s)",
+                        type=float, default=2.0)
+    parser.add_argument("-n", "--segment",
+                        help="Segment to scan instead of start and end, "
+                        "can be repeated (START:STOP[:DWELL[:FFT]])",
+                        action='append')
+    parser.add_argument("-t", "--adaptive",
+                        help="Survey quickly then revisit steps this far "
+                        "above the noise floor (dB) at the dwell and FFT "
+                        "bins given",
+                        type=float)
+    parser.add_argument("-q", "--queue",
+                        help="Action when analysis falls behind",
+                        choices=['block', 'oldest', 'newest'],
+                        default='block')
+    parser.add_argument("--queue-size", help="Captures waiting for analysis",
+                        type=int, default=16)
     group = parser.add_mutually_exclusive_group()
-    group.add_argument("-i", "--index", help="Device index (from 0)", type=int,
-                       default=0)
+    group.add_argument("-i", "--index",
+                       help="Device index (from 0), several split the range",
+                       type=int, nargs='+', default=[0])
     group.add_argument("-r", "--remote", help="Server IP and port", type=str)
     types = File.get_type_pretty(File.Types.SAVE)
     types += File.get_type_pretty(File.Types.PLOT)
@@ -91,7 +109,12 @@ def __arguments():
 
     error = None
     isGui = True
-    if args.start is not None or args.end is not None:
+    if args.segment is not None:
+        if args.file is not None:
+            isGui = False
+        else:
+            error = "No filename specified"
+    elif args.start is not None or args.end is not None:
         if args.start is not None:
             if args.end is not None:
                 if args.file is not None:
@@ -28,8 +28,7 @@ import socket
 import struct
 import threading
 
-import numpy
-
+from dsp import raw_to_iq
 from events import post_event, EventThread, Event
 
 
@@ -38,6 +37,12 @@ class RtlTcpCmd(object):
     SET_SAMPLE_RATE = 0x2
     SET_GAIN_MODE = 0x3
     SET_GAIN = 0x4
+    SET_FREQ_CORRECTION = 0x5
+    SET_IF_GAIN = 0x6
+    SET_AGC_MODE = 0x8
+    SET_DIRECT_SAMPLING = 0x9
+    SET_OFFSET_TUNING = 0xa
+    SET_GAIN_INDEX = 0xd
 
 
 class RtlTcp(object):
@@ -48,6 +53,8 @@ class RtlTcp(object):
         self.threadBuffer = None
         self.tuner = 0
         self.rate = 0
+        self.ppm = 0
+        self.position = 0
 
         self.__setup(notify)
 
@@ -72,17 +79,6 @@ class RtlTcp(object):
 
         self.threadBuffer.sendall(send)
 
-    def __read_raw(self, samples):
-        return self.threadBuffer.recv(samples * 2)
-
-    def __raw_to_iq(self, raw):
-        iq = numpy.empty(len(raw) / 2, 'complex')
-        iq.real, iq.imag = raw[::2], raw[1::2]
-        iq /= (255 / 2)
-        iq -= 1
-
-        return iq
-
     def set_sample_rate(self, rate):
         self.__send_command(RtlTcpCmd.SET_SAMPLE_RATE, rate)
         self.rate = rate
@@ -93,17 +89,46 @@ class RtlTcp(object):
     def set_gain(self, gain):
         self.__send_command(RtlTcpCmd.SET_GAIN, gain * 10)
 
+    def set_freq_correction(self, ppm):
+        if ppm != self.ppm:
+            self.__send_command(RtlTcpCmd.SET_FREQ_CORRECTION, ppm)
+            self.ppm = ppm
+
+    def get_freq_correction(self):
+        return self.ppm
+
+    def set_agc_mode(self, enabled):
+        self.__send_command(RtlTcpCmd.SET_AGC_MODE, int(enabled))
+
+    def set_direct_sampling(self, direct):
+        self.__send_command(RtlTcpCmd.SET_DIRECT_SAMPLING, direct)
+
+    def set_offset_tuning(self, enabled):
+        self.__send_command(RtlTcpCmd.SET_OFFSET_TUNING, int(enabled))
+
+    def set_gain_index(self, index):
+        self.__send_command(RtlTcpCmd.SET_GAIN_INDEX, index)
+
+    def set_if_gain(self, stage, gain):
+        self.__send_command(RtlTcpCmd.SET_IF_GAIN,
+                            (stage << 16) | (int(gain * 10) & 0xffff))
+
     def set_center_freq(self, freq):
         self.__send_command(RtlTcpCmd.SET_FREQ, freq)
-        self.__read_raw(int(self.rate * 2 * 0.1))
+        self.position = self.threadBuffer.get_offset()
 
     def get_tuner_type(self):
         return self.tuner
 
     def read_samples(self, samples):
+        return raw_to_iq(self.read_bytes(samples * 2))
+
+    def read_bytes(self, length):
+        self.position, data = self.threadBuffer.read(self.position, length)
+        return data
 
-        raw = self.__read_raw(samples)
-        return self.__raw_to_iq(raw)
+    def skip_bytes(self, length):
+        self.position += length
 
     def close(self):
         self.threadBuffer.abort()
@@ -112,17 +137,23 @@ class RtlTcp(object):
 
 class ThreadBuffer(threading.Thread):
     name = 'Buffer'
-    buffer = ""
-    cancel = False
-    readLen = 0
-    read = 0
-    done = False
-    READ_SIZE = 4096
+    SIZE = 2 ** 23
+    READ_SIZE = 2 ** 16
 
     def __init__(self, host, port, notify):
         threading.Thread.__init__(self)
         self.notify = notify
 
+        self.cancel = False
+        self.closed = False
+        self.total = 0
+        self.first = 0
+        self.resize = None
+        self.size = None
+        self.ring = None
+        self.view = None
+        self.__alloc(self.SIZE)
+
         self.condition = threading.Condition()
         self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.socket.settimeout(5)
@@ -134,59 +165,74 @@ class ThreadBuffer(threading.Thread):
     def run(self):
         try:
             while not self.cancel:
-                if self.readLen > 0:
-                    self.__read_stream()
-                else:
-                    self.__skip_stream()
+                if self.resize is not None:
+                    self.__do_resize()
+                pos = self.total % self.size
+                length = min(self.size - pos, self.READ_SIZE)
+                recv = self.socket.recv_into(self.view[pos:pos + length],
+                                             length)
+                if recv == 0:
+                    break
+                with self.condition:
+                    self.total += recv
+                    self.condition.notify_all()
         except socket.error as error:
             post_event(self.notify, EventThread(Event.ERROR, 0, error))
         finally:
             self.socket.close()
-            self.__do_notify()
-
-    def __do_wait(self):
-        self.condition.acquire()
-        while not self.done:
-            self.condition.wait(2)
-        self.done = False
-        self.condition.release()
-
-    def __do_notify(self):
-        self.condition.acquire()
-        self.done = True
-        self.condition.notify()
-        self.condition.release()
-
-    def __read_stream(self):
-        data = []
-        recv = ""
-
-        self.buffer = ""
-        while self.readLen > 0:
-            recv = self.socket.recv(self.readLen)
-            if len(recv) == 0:
-                break
-            data.append(recv)
-            self.readLen -= len(recv)
-
-        self.buffer = bytearray(''.join(data))
-        self.__do_notify()
-
-    def __skip_stream(self):
-        total = self.READ_SIZE
-        while total > 0:
-            recv = self.socket.recv(total)
-            if len(recv) == 0:
-                break
-            total -= len(recv)
+            with self.condition:
+                self.closed = True
+                self.condition.notify_all()
+
+    def __alloc(self, size):
+        self.size = size
+        self.ring = bytearray(size)
+        self.view = memoryview(self.ring)
+
+    def __do_resize(self):
+        with self.condition:
+            self.__alloc(self.resize)
+            self.first = self.total
+            self.resize = None
+            self.condition.notify_all()
+
+    def __get_oldest(self):
+        return max(self.first, self.total - self.size + self.READ_SIZE)
+
+    def __copy(self, start, end):
+        data = bytearray(end - start)
+        pos = start % self.size
+        split = min(end - start, self.size - pos)
+        data[:split] = self.view[pos:pos + split]
+        data[split:] = self.view[:end - start - split]
+
+        return data
 
     def get_header(self):
         return self.header
 
-    def recv(self, length):
-        self.readLen = length
-        self.__do_wait()
-        return self.buffer
+    def get_offset(self):
+        return self.total
+
+    def read(self, offset, length):
+        with self.condition:
+            if length > self.size - self.READ_SIZE:
+                size = self.size
+                while length > size - self.READ_SIZE:
+                    size *= 2
+                self.resize = size
+                while self.resize is not None and not self.closed:
+                    self.condition.wait()
+
+            while True:
+                offset = max(offset, self.__get_oldest())
+                end = offset + length
+                while self.total < end and not self.closed:
+                    self.condition.wait()
+                end = min(end, self.total)
+                data = self.__copy(offset, end)
+                if offset >= self.__get_oldest():
+                    return end, data
 
     def sendall(self, data):
         self.socket.sendall(data)
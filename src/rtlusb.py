@@ -0,0 +1,64 @@
+#
+# rtlsdr_scan
+#
+# http://eartoearoak.com/software/rtlsdr-scanner
+#
+# Copyright 2012 - 2014 Al Brown
+#
+# A frequency scanning GUI for the OsmoSDR rtl-sdr library at
+# http://sdr.osmocom.org/trac/wiki/rtl-sdr
+#
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, or (at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import rtlsdr
+
+
+class RtlUsb(rtlsdr.RtlSdr):
+    def __init__(self, index):
+        rtlsdr.RtlSdr.__init__(self, index)
+        self.ppm = 0
+
+    def __check(self, result, function):
+        if result < 0:
+            self.close()
+            raise IOError('Error code {} when calling {}'.format(result,
+                                                                 function))
+
+    def set_freq_correction(self, ppm):
+        if ppm != self.ppm:
+            rtlsdr.RtlSdr.set_freq_correction(self, ppm)
+            self.ppm = ppm
+
+    def get_freq_correction(self):
+        return self.ppm
+
+    def set_offset_tuning(self, enabled):
+        result = rtlsdr.librtlsdr.rtlsdr_set_offset_tuning(self.dev_p,
+                                                           int(enabled))
+        self.__check(result, 'rtlsdr_set_offset_tuning()')
+
+    def set_gain_index(self, index):
+        self.set_gain(self.valid_gains_db[index])
+
+    def set_if_gain(self, stage, gain):
+        result = rtlsdr.librtlsdr.rtlsdr_set_tuner_if_gain(self.dev_p, stage,
+                                                           int(gain * 10))
+        self.__check(result, 'rtlsdr_set_tuner_if_gain()')
+
+
+if __name__ == '__main__':
+    print 'Please run rtlsdr_scan.py'
+    exit(1)
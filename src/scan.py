@@ -23,131 +23,505 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
 
-import itertools
+import Queue
 import math
+import multiprocessing
+import os
+import tempfile
 import threading
 import time
 
-import matplotlib
-import rtlsdr
+import numpy
 
-from constants import SAMPLE_RATE, BANDWIDTH, WINFUNC
+from constants import SAMPLE_RATE, SETTLE_BLOCK, Backpressure
+from dsp import psd, psd_freqs, raw_to_iq
 from events import EventThread, Event, post_event
 import rtltcp
+from misc import calc_bandwidth, calc_samples
+from rtlusb import RtlUsb
+
+
+class ScanDevice(object):
+    def __init__(self, settings, index, nfft):
+        device = settings.devicesRtl[index]
+        self.index = index
+        self.indexRtl = device.indexRtl
+        if self.indexRtl is None:
+            self.indexRtl = index
+        self.isDevice = device.isDevice
+        self.server = device.server
+        self.port = device.port
+        self.gain = device.gain
+        self.agc = device.agc
+        self.directSampling = device.directSampling
+        self.offsetTuning = device.offsetTuning
+        self.ppm = int(round(device.calibration))
+        self.calibration = device.calibration
+        self.cal = device.calibration - self.ppm
+        self.lo = device.lo * 1e6
+        self.offset = device.offset
+        self.rate = device.sampleRate
+        self.bandwidth = calc_bandwidth(self.rate, self.offset, nfft)
+        self.binWidth = float(self.rate) / nfft
+        self.settleBytes = calc_settle_bytes(device.settle, self.rate)
+        self.sdr = None
+        self.plan = []
+        self.steps = []
+        self.span = 0
+
+    def get_margins(self):
+        return (self.offset + self.bandwidth,
+                self.offset + self.bandwidth * 2)
+
+
+class ScanStep(object):
+    def __init__(self, freq, start, stop, samples, nfft, bandwidth,
+                 sweep=0):
+        self.freq = freq
+        self.start = start
+        self.stop = stop
+        self.samples = samples
+        self.nfft = nfft
+        self.bandwidth = bandwidth
+        self.sweep = sweep
+        self.level = None
+        self.floor = None
+        self.revisit = False
 
 
 class ThreadScan(threading.Thread):
-    def __init__(self, notify, queue, sdr, settings, device, samples, isCal):
+    BUFFERS = 2
+    TIMEOUT = 0.5
+    SURVEY = 'survey'
+    SURVEY_NFFT = 256
+
+    def __init__(self, notify, queue, sdr, settings, devices, isCal,
+                 ring=None, sweeps=1):
         threading.Thread.__init__(self)
         self.name = 'Scan'
         self.notify = notify
         self.queue = queue
-        self.sdr = sdr
-        self.fstart = settings.start * 1e6
-        self.fstop = settings.stop * 1e6
-        self.samples = int(samples)
+        self.segments = settings.get_segments(isCal)
         self.isCal = isCal
-        self.indexRtl = settings.indexRtl
-        self.isDevice = settings.devicesRtl[device].isDevice
-        self.server = settings.devicesRtl[device].server
-        self.port = settings.devicesRtl[device].port
-        self.gain = settings.devicesRtl[device].gain
-        self.lo = settings.devicesRtl[device].lo * 1e6
-        self.offset = settings.devicesRtl[device].offset
+        self.sweeps = sweeps
+        self.sweep = 0
+        self.delay = settings.scanDelay
+        self.backpressure = settings.backpressure
+        self.adaptive = settings.adaptive and not isCal
+        self.adaptiveLevel = settings.adaptiveLevel
+        self.adaptiveDwell = settings.adaptiveDwell
+        self.adaptiveNfft = settings.adaptiveNfft
+        self.surveyed = threading.Event()
+        self.wake = threading.Event()
+        nfft = min([segment.nfft for segment in self.segments])
+        if self.adaptive:
+            nfft = min(nfft, self.adaptiveNfft)
+        self.devices = [ScanDevice(settings, index, nfft)
+                        for index in devices]
+        self.devices[0].sdr = sdr
+        self.ring = ring
+        self.captures = Queue.Queue(self.BUFFERS * len(self.devices))
+        self.threadHandoff = None
+        self.rate = None
         self.cancel = False
+        self.stopEnd = False
+        self.failed = False
 
         post_event(self.notify, EventThread(Event.STARTING))
-        steps = int((self.__f_stop() - self.__f_start()) / self.__f_step())
-        post_event(self.notify, EventThread(Event.STEPS, steps))
+        self.steps = self.__plan()
         self.start()
 
-    def __f_start(self):
-        return self.fstart - self.offset - BANDWIDTH
+    def __plan(self):
+        ranges = []
+        for segment in sorted(self.segments, key=lambda s: s.start):
+            if ranges and segment.start <= ranges[-1][1]:
+                ranges[-1] = (ranges[-1][0],
+                              max(ranges[-1][1], segment.stop),
+                              max(ranges[-1][2], segment.dwell),
+                              max(ranges[-1][3], segment.nfft))
+            else:
+                ranges.append((segment.start, segment.stop,
+                               segment.dwell, segment.nfft))
+
+        span = sum([stop - start for start, stop, _dwell, _nfft in ranges])
+        total = sum([device.bandwidth for device in self.devices])
+        shares = []
+        start = 0
+        for device in self.devices:
+            if device is self.devices[-1]:
+                stop = span
+            else:
+                stop = start + span * device.bandwidth / total
+            shares.append(self.__cut(ranges, start, stop))
+            start = stop
+
+        steps = 0
+        for device, share in zip(self.devices, shares):
+            device.plan = self.__compile(device, share)
+            steps += len(device.plan)
+
+        return steps
+
+    def __cut(self, ranges, start, stop):
+        share = []
+        pos = 0
+        for begin, end, dwell, nfft in ranges:
+            lower = max(begin, begin + start - pos)
+            upper = min(end, begin + stop - pos)
+            if lower < upper:
+                share.append((lower, upper, dwell, nfft))
+            pos += end - begin
+
+        return share
+
+    def __compile(self, device, share):
+        below, above = device.get_margins()
+        merged = []
+        for start, stop, dwell, nfft in share:
+            if merged and start * 1e6 - below <= merged[-1][1] * 1e6 + above:
+                merged[-1] = (merged[-1][0], stop,
+                              max(merged[-1][2], dwell),
+                              max(merged[-1][3], nfft))
+            else:
+                merged.append((start, stop, dwell, nfft))
 
-    def __f_stop(self):
-        return self.fstop + self.offset + BANDWIDTH * 2
+        plan = []
+        fstep = device.bandwidth / 2
+        for start, stop, dwell, nfft in merged:
+            fstart = start * 1e6 - below
+            fstart = math.floor(fstart / device.binWidth) * device.binWidth
+            fstop = stop * 1e6 + above
+            samples = calc_samples(dwell, device.rate)
+            for step in range(int((fstop - fstart) / fstep) + 1):
+                plan.append(ScanStep(fstart + step * fstep, start, stop,
+                                     samples, nfft, device.bandwidth))
+            device.span += fstop - fstart
 
-    def __f_step(self):
-        return BANDWIDTH / 2
+        return plan
 
-    def __rtl_setup(self):
+    def __rtl_setup(self, device):
 
-        if self.sdr is not None:
+        if device.sdr is not None:
             return
 
         tuner = 0
 
-        if self.isDevice:
+        if device.isDevice:
             try:
-                self.sdr = rtlsdr.RtlSdr(self.indexRtl)
-                self.sdr.set_sample_rate(SAMPLE_RATE)
-                self.sdr.set_manual_gain_enabled(1)
-                self.sdr.set_gain(self.gain)
-                tuner = self.sdr.get_tuner_type()
+                device.sdr = RtlUsb(device.indexRtl)
+                self.__rtl_config(device)
+                tuner = device.sdr.get_tuner_type()
             except IOError as error:
                 post_event(self.notify, EventThread(Event.ERROR,
                                                     0, error.message))
         else:
             try:
-                self.sdr = rtltcp.RtlTcp(self.server, self.port, self.notify)
-                self.sdr.set_sample_rate(SAMPLE_RATE)
-                self.sdr.set_manual_gain_enabled(1)
-                self.sdr.set_gain(self.gain)
-                tuner = self.sdr.get_tuner_type()
+                device.sdr = rtltcp.RtlTcp(device.server, device.port,
+                                           self.notify)
+                self.__rtl_config(device)
+                tuner = device.sdr.get_tuner_type()
             except IOError as error:
                 post_event(self.notify, EventThread(Event.ERROR,
                                                     0, error))
 
         return tuner
 
+    def __rtl_config(self, device):
+        device.sdr.set_sample_rate(device.rate)
+        if device.directSampling:
+            device.sdr.set_direct_sampling(device.directSampling)
+        if device.offsetTuning:
+            device.sdr.set_offset_tuning(True)
+        device.sdr.set_manual_gain_enabled(1)
+        device.sdr.set_gain(device.gain)
+        if device.agc:
+            device.sdr.set_agc_mode(True)
+        device.sdr.set_freq_correction(device.ppm)
+
     def run(self):
-        tuner = self.__rtl_setup()
-        if self.sdr is None:
-            return
+        tuner = None
+        for device in self.devices:
+            info = self.__rtl_setup(device)
+            if device.sdr is None:
+                self.__rtl_close_split()
+                return
+            if tuner is None:
+                tuner = info
+            device.sdr.set_freq_correction(device.ppm)
+            device.cal = device.calibration - device.sdr.get_freq_correction()
         post_event(self.notify, EventThread(Event.INFO, None, tuner))
 
-        freq = self.__f_start()
-        timeStamp = math.floor(time.time())
-        while freq <= self.__f_stop():
-            if self.cancel:
-                post_event(self.notify,
-                           EventThread(Event.STOPPED))
-                self.rtl_close()
-                return
+        self.threadHandoff = threading.Thread(target=self.__handoff,
+                                              name='Handoff')
+        self.threadHandoff.start()
+        complete = False
+        try:
+            while True:
+                complete = self.__sweep_once()
+                if not complete or self.stopEnd:
+                    break
+                self.sweep += 1
+                if self.sweeps is not None and self.sweep >= self.sweeps:
+                    break
+                if not self.__delay():
+                    break
+        finally:
+            self.captures.put(None)
+            self.threadHandoff.join()
+            self.__rtl_close_split()
+
+        if self.cancel:
+            post_event(self.notify, EventThread(Event.STOPPED))
+            self.rtl_close()
+        elif complete:
+            post_event(self.notify, EventThread(Event.FINISHED, 0, self.rate))
+
+            if self.isCal:
+                post_event(self.notify, EventThread(Event.CAL))
+
+    def __sweep_once(self):
+        timeStart = time.time()
+        timeStamp = timeStart
+        post_event(self.notify, EventThread(Event.SWEEP_START,
+                                            self.sweep, self.steps))
+        for device in self.devices:
+            device.steps = [ScanStep(step.freq, step.start, step.stop,
+                                     step.samples, step.nfft, step.bandwidth,
+                                     self.sweep)
+                            for step in device.plan]
+
+        complete = self.__sweep_devices(timeStamp)
+        if complete and self.adaptive:
+            self.surveyed.clear()
+            self.captures.put(self.SURVEY)
+            self.surveyed.wait()
+            complete = self.__sweep_devices(timeStamp)
+
+        if complete:
+            elapsed = time.time() - timeStart
+            if elapsed > 0:
+                span = sum([device.span for device in self.devices])
+                self.rate = span / elapsed
+            post_event(self.notify, EventThread(Event.SWEEP_END,
+                                                self.sweep, self.rate))
+
+        return complete
+
+    def __delay(self):
+        for count in range(self.delay, 0, -1):
+            post_event(self.notify, EventThread(Event.DELAY_COUNT,
+                                                self.delay, count))
+            self.wake.wait(1)
+            if self.cancel or self.stopEnd:
+                return False
+
+        return True
+
+    def __sweep_devices(self, timeStamp):
+        threads = []
+        for device in self.devices[1:]:
+            thread = ThreadSweep(self.__sweep, device, timeStamp)
+            threads.append(thread)
+        complete = self.__sweep(self.devices[0], timeStamp)
+        for thread in threads:
+            thread.join()
+            complete &= thread.complete
+
+        return complete
+
+    def __sweep(self, device, timeStamp):
+        for step in device.steps:
+            if self.cancel or self.failed:
+                return False
             try:
-                scan = self.rtl_scan(freq)
+                scan = self.rtl_scan(step.freq, device, step.samples)
                 if len(scan):
-                    self.queue.put([freq, (timeStamp, scan)])
-                    post_event(self.notify,
-                               EventThread(Event.DATA))
+                    self.captures.put((step, timeStamp, scan, device))
             except IOError:
-                if self.sdr is not None:
-                    self.rtl_close()
-                self.__rtl_setup()
+                if device.sdr is not None:
+                    device.sdr.close()
+                self.__rtl_setup(device)
             except (TypeError, AttributeError) as error:
                 if self.notify:
                     post_event(self.notify,
                                EventThread(Event.ERROR,
                                            0, error.message))
-                return
+                self.failed = True
+                return False
             except WindowsError:
-                if self.sdr is not None:
-                    self.rtl_close()
-
-            freq += self.__f_step()
+                if device.sdr is not None:
+                    device.sdr.close()
+
+        return True
+
+    def __handoff(self):
+        pending = None
+        while True:
+            capture = self.captures.get()
+            if capture == self.SURVEY:
+                steps = self.__revisit()
+                post_event(self.notify, EventThread(Event.STEPS_ADD,
+                                                    steps, self.sweep))
+                self.__release(pending)
+                pending = None
+                self.surveyed.set()
+                continue
+            self.__release(pending)
+            pending = None
+            if capture is None:
+                return
 
-        post_event(self.notify, EventThread(Event.FINISHED, 0, None))
+            step, timeStamp, scan, device = capture
+            if self.cancel:
+                self.__drop([step, (timeStamp, scan), device.index,
+                             device.cal])
+                continue
+            survey = self.adaptive and not step.revisit
+            if survey:
+                self.__survey(step, device, scan)
+            capture = [step, (timeStamp, scan), device.index, device.cal]
+            if self.ring is not None:
+                scan = self.__store(step, scan)
+                if scan is None:
+                    self.__drop(capture)
+                    continue
+                capture[1] = (timeStamp, scan)
+            if survey:
+                pending = capture
+            else:
+                self.__release(capture)
+
+    def __store(self, step, scan):
+        slot = self.ring.put(scan, 0)
+        if slot is not None:
+            return slot
+        if self.backpressure == Backpressure.NEWEST:
+            return None
+        if self.backpressure == Backpressure.BLOCK:
+            post_event(self.notify, EventThread(Event.LATE, step.sweep))
+
+        while not self.cancel:
+            if self.backpressure == Backpressure.OLDEST:
+                try:
+                    self.__drop(self.queue.get_nowait())
+                except Queue.Empty:
+                    pass
+            slot = self.ring.put(scan, self.TIMEOUT)
+            if slot is not None:
+                return slot
+
+        return None
+
+    def __release(self, capture):
+        if capture is None:
+            return
+        if self.cancel:
+            self.__drop(capture)
+            return
 
-        if self.isCal:
-            post_event(self.notify, EventThread(Event.CAL))
+        try:
+            self.queue.put_nowait(capture)
+        except Queue.Full:
+            if self.backpressure == Backpressure.NEWEST:
+                self.__drop(capture)
+                return
+            elif self.backpressure == Backpressure.OLDEST:
+                while True:
+                    try:
+                        self.__drop(self.queue.get_nowait())
+                    except Queue.Empty:
+                        pass
+                    try:
+                        self.queue.put_nowait(capture)
+                        break
+                    except Queue.Full:
+                        pass
+            else:
+                post_event(self.notify, EventThread(Event.LATE,
+                                                    capture[0].sweep))
+                while True:
+                    if self.cancel:
+                        self.__drop(capture)
+                        return
+                    try:
+                        self.queue.put(capture, timeout=self.TIMEOUT)
+                        break
+                    except Queue.Full:
+                        pass
+
+        post_event(self.notify, EventThread(Event.DATA))
+
+    def __drop(self, capture):
+        if self.ring is not None:
+            self.ring.release(capture[1][1])
+        post_event(self.notify, EventThread(Event.DROPPED, capture[0].sweep))
+
+    def __survey(self, step, device, scan):
+        powers, freqs = psd(raw_to_iq(scan), self.SURVEY_NFFT, 0.5,
+                            'Hamming', device.rate)
+        offsets = numpy.abs(freqs)
+        freqs += step.freq
+        mask = ((device.offset <= offsets) &
+                (offsets <= device.offset + device.bandwidth / 2) &
+                (step.start * 1e6 <= freqs) & (freqs < step.stop * 1e6))
+        if numpy.any(mask):
+            with numpy.errstate(divide='ignore'):
+                levels = 10 * numpy.log10(powers[mask])
+            step.level = numpy.max(levels)
+            step.floor = numpy.median(levels)
+
+    def __revisit(self):
+        floors = [step.floor
+                  for device in self.devices for step in device.steps
+                  if step.floor is not None]
+        if not floors:
+            return 0
+        threshold = numpy.median(floors) + self.adaptiveLevel
+
+        steps = 0
+        for device in self.devices:
+            samples = calc_samples(self.adaptiveDwell, device.rate)
+            plan = []
+            for step in device.steps:
+                if step.level is not None and step.level > threshold:
+                    revisit = ScanStep(step.freq, step.start, step.stop,
+                                       samples, self.adaptiveNfft,
+                                       step.bandwidth, step.sweep)
+                    revisit.revisit = True
+                    plan.append(revisit)
+            device.steps = plan
+            steps += len(plan)
+
+        return steps
+
+    def __rtl_close_split(self):
+        for device in self.devices[1:]:
+            if device.sdr is not None:
+                device.sdr.close()
+                device.sdr = None
 
     def abort(self):
         self.cancel = True
-
-    def rtl_scan(self, freq):
-        self.sdr.set_center_freq(freq + self.lo)
+        self.wake.set()
+
+    def stop_at_end(self):
+        self.stopEnd = True
+        self.wake.set()
+
+    def rtl_scan(self, freq, device=None, samples=None):
+        if device is None:
+            device = self.devices[0]
+        if samples is None:
+            samples = device.plan[0].samples
+        device.sdr.set_center_freq(freq + device.lo)
+        if device.settleBytes > 0:
+            if device.isDevice:
+                device.sdr.read_bytes(device.settleBytes)
+            else:
+                device.sdr.skip_bytes(device.settleBytes)
         try:
-            capture = self.sdr.read_samples(self.samples)
+            capture = numpy.frombuffer(device.sdr.read_bytes(samples * 2),
+                                       numpy.uint8).copy()
         except MemoryError as error:
             post_event(self.notify, EventThread(Event.ERROR,
                                                 0, error))
@@ -156,69 +530,272 @@ class ThreadScan(threading.Thread):
         return capture
 
     def rtl_close(self):
-        self.sdr.close()
+        self.devices[0].sdr.close()
 
     def get_sdr(self):
-        return self.sdr
+        return self.devices[0].sdr
 
+    def get_rate(self):
+        return self.rate
 
-def anaylse_data(freq, data, cal, nfft, overlap, winFunc):
-    spectrum = {}
-    timeStamp = data[0]
-    samples = data[1]
-    pos = WINFUNC[::2].index(winFunc)
-    function = WINFUNC[1::2][pos]
-    powers, freqs = matplotlib.mlab.psd(samples,
-                                        NFFT=nfft,
-                                        noverlap=int((nfft) * overlap),
-                                        Fs=SAMPLE_RATE / 1e6,
-                                        window=function(nfft))
-    for freqPsd, pwr in itertools.izip(freqs, powers):
-        xr = freqPsd + (freq / 1e6)
-        xr = xr + (xr * cal / 1e6)
-        spectrum[xr] = pwr
-
-    return (timeStamp, freq, spectrum)
-
-
-def update_spectrum(notify, lock, start, stop, freqCentre, data, offset,
-                    spectrum, average, alertLevel=None):
-    with lock:
-        updated = False
-        if average:
-            if len(spectrum) > 0:
-                timeStamp = min(spectrum)
+
+class ThreadSweep(threading.Thread):
+    def __init__(self, sweep, device, timeStamp):
+        threading.Thread.__init__(self)
+        self.name = 'Sweep'
+        self.sweep = sweep
+        self.device = device
+        self.timeStamp = timeStamp
+        self.complete = False
+
+        self.start()
+
+    def run(self):
+        self.complete = self.sweep(self.device, self.timeStamp)
+
+
+def get_scan_devices(devicesRtl, indexRtl):
+    devices = [indexRtl]
+    for i in range(len(devicesRtl)):
+        if devicesRtl[i].split and i != indexRtl:
+            devices.append(i)
+
+    return devices
+
+
+def get_analysis_depth():
+    return multiprocessing.cpu_count() * 2
+
+
+def calc_ring_slots(queueSize, devices, size):
+    slots = (queueSize + get_analysis_depth() +
+             (ThreadScan.BUFFERS + 1) * devices)
+    limit = max(devices + 2, CaptureRing.BUDGET // size)
+
+    return min(slots, limit)
+
+
+def calc_settle_bytes(settle, rate=SAMPLE_RATE):
+    blocks = math.ceil(rate * 2 * settle / SETTLE_BLOCK)
+
+    return int(blocks) * SETTLE_BLOCK
+
+
+def calc_settle(sdr, freq, rate=SAMPLE_RATE, duration=0.25, trials=4):
+    chunk = int(rate / 1000)
+    length = calc_settle_bytes(duration, rate)
+    settle = 0
+    for trial in range(trials):
+        sdr.set_center_freq(freq + ((trial % 2) * 2 - 1) * rate)
+        sdr.read_bytes(SETTLE_BLOCK)
+        sdr.set_center_freq(freq)
+        raw = numpy.frombuffer(sdr.read_bytes(length), numpy.uint8)
+        iq = raw_to_iq(raw)
+        chunks = len(iq) // chunk
+        iq = iq[:chunks * chunk].reshape(chunks, chunk)
+        powers = numpy.mean(iq.real ** 2 + iq.imag ** 2, axis=1)
+
+        steady = powers[chunks // 2:]
+        level = numpy.median(steady)
+        tolerance = max(3 * numpy.std(steady), level * 0.1)
+        unsettled = numpy.flatnonzero(numpy.abs(powers[:chunks // 2] - level) >
+                                      tolerance)
+        if len(unsettled):
+            settle = max(settle, (unsettled[-1] + 2) * chunk / rate)
+
+    return settle
+
+
+class CaptureSlot(object):
+    def __init__(self, path, shape, index, length):
+        self.path = path
+        self.shape = shape
+        self.index = index
+        self.length = length
+
+
+class CaptureRing(object):
+    SLOTS = 8
+    BUDGET = 64 * 1024 * 1024
+    PREFIX = 'rsca_'
+
+    def __init__(self, size, slots=SLOTS):
+        self.size = size
+        self.fd, self.path = tempfile.mkstemp(prefix=self.PREFIX)
+        self.buffer = numpy.memmap(self.path, numpy.uint8, 'w+',
+                                   shape=(slots, size))
+        self.free = Queue.Queue()
+        for index in range(slots):
+            self.free.put(index)
+
+    def put(self, capture, timeout):
+        if len(capture) > self.size:
+            return capture
+        try:
+            if timeout:
+                index = self.free.get(timeout=timeout)
             else:
-                timeStamp = data[0]
-        else:
-            timeStamp = data[0]
-        scan = data[1]
+                index = self.free.get_nowait()
+        except Queue.Empty:
+            return None
+
+        self.buffer[index, :len(capture)] = capture
+
+        return CaptureSlot(self.path, self.buffer.shape, index, len(capture))
+
+    def release(self, capture):
+        if isinstance(capture, CaptureSlot) and capture.path == self.path:
+            self.free.put(capture.index)
+
+    def get_size(self):
+        return self.size
+
+    def get_slots(self):
+        return self.buffer.shape[0]
+
+    def close(self):
+        del self.buffer
+        os.close(self.fd)
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+
+__captureMap = None
+
+
+def load_capture(capture):
+    global __captureMap
+    if not isinstance(capture, CaptureSlot):
+        return capture
+
+    if __captureMap is None or __captureMap.filename != capture.path:
+        __captureMap = numpy.memmap(capture.path, numpy.uint8, 'r',
+                                    shape=capture.shape)
+
+    return __captureMap[capture.index, :capture.length]
+
+
+def anaylse_data(freq, data, cal, nfft, overlap, winFunc, rate=SAMPLE_RATE):
+    timeStamp = data[0]
+    samples = raw_to_iq(load_capture(data[1]))
+    fs = rate / 1e6
+    powers, _freqs = psd(samples, nfft, overlap, winFunc, fs)
+    record = ((freq / 1e6) - fs / 2, fs / nfft, cal, powers)
+
+    return (timeStamp, freq, record)
+
+
+class ThreadMerge(threading.Thread):
+    QUEUE_SIZE = 256
+    BATCH_SIZE = 32
+
+    def __init__(self, notify, lock, spectrum):
+        threading.Thread.__init__(self)
+        self.name = 'Merge'
+        self.daemon = True
+        self.notify = notify
+        self.lock = lock
+        self.spectrum = spectrum
+        self.queue = Queue.Queue(self.QUEUE_SIZE)
+        self.start()
+
+    def run(self):
+        while True:
+            batch = [self.queue.get()]
+            while len(batch) < self.BATCH_SIZE:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except Queue.Empty:
+                    break
+
+            steps = [step for step in batch if step is not None]
+            if len(steps):
+                try:
+                    self.__merge(steps)
+                except Exception as error:
+                    post_event(self.notify, EventThread(Event.ERROR,
+                                                        0, error))
+                    depth = self.queue.qsize()
+                    for _step in steps:
+                        post_event(self.notify,
+                                   EventThread(Event.UPDATED, depth, False))
+            if len(steps) < len(batch):
+                return
+
+    def __merge(self, steps):
+        updates = []
+        for step in steps:
+            (start, stop, freqCentre, data, offset, bandwidth, average,
+             alertLevel, replace) = step
+            freqs, levels, windows = self.__calc_levels(start, stop,
+                                                        freqCentre,
+                                                        data[1], offset,
+                                                        bandwidth)
+            updates.append((data[0], freqs, levels, windows, average,
+                            alertLevel, replace))
+
+        results = []
+        with self.lock:
+            for (timeStamp, freqs, levels, windows, average, alertLevel,
+                 replace) in updates:
+                if average and len(self.spectrum) > 0:
+                    timeStamp = self.spectrum.get_oldest()
+                if timeStamp not in self.spectrum:
+                    self.spectrum[timeStamp] = {}
+                elif replace and not average:
+                    for windowStart, windowStop in windows:
+                        self.spectrum.clear_levels(timeStamp,
+                                                   windowStart, windowStop)
+                merged = None
+                if len(freqs):
+                    merged, existing = self.spectrum.merge_levels(timeStamp,
+                                                                  freqs,
+                                                                  levels)
+                if merged is not None:
+                    results.append((merged[existing], alertLevel))
+                else:
+                    results.append((None, alertLevel))
+
+        depth = self.queue.qsize()
+        for merged, alertLevel in results:
+            updated = merged is not None
+            if updated and alertLevel is not None:
+                if numpy.any(merged > alertLevel):
+                    post_event(self.notify, EventThread(Event.LEVEL))
+            post_event(self.notify, EventThread(Event.UPDATED, depth, updated))
+
+    def __calc_levels(self, start, stop, freqCentre, scan, offset, bandwidth):
+        freqs = psd_freqs(scan)
+        with numpy.errstate(divide='ignore'):
+            levels = 10 * numpy.log10(scan[3], dtype=numpy.float64)
 
         upperStart = freqCentre + offset
-        upperEnd = freqCentre + offset + BANDWIDTH / 2
-        lowerStart = freqCentre - offset - BANDWIDTH / 2
+        upperEnd = freqCentre + offset + bandwidth / 2
+        lowerStart = freqCentre - offset - bandwidth / 2
         lowerEnd = freqCentre - offset
 
-        if timeStamp not in spectrum:
-            spectrum[timeStamp] = {}
-
-        for freq in scan:
-            if start <= freq < stop:
-                power = 10 * math.log10(scan[freq])
-                if upperStart <= freq * 1e6 <= upperEnd or \
-                   lowerStart <= freq * 1e6 <= lowerEnd:
-                    if freq in spectrum[timeStamp]:
-                        spectrum[timeStamp][freq] = \
-                            (spectrum[timeStamp][freq] + power) / 2
-                        if alertLevel is not None and (spectrum[timeStamp][freq] >
-                                                       alertLevel):
-                            post_event(notify, EventThread(Event.LEVEL))
-                        updated = True
-                    else:
-                        spectrum[timeStamp][freq] = power
-                        updated = True
-
-    post_event(notify, EventThread(Event.UPDATED, None, updated))
+        freqsHz = freqs * 1e6
+        mask = (start <= freqs) & (freqs < stop)
+        mask &= (((upperStart <= freqsHz) & (freqsHz <= upperEnd)) |
+                 ((lowerStart <= freqsHz) & (freqsHz <= lowerEnd)))
+
+        windows = [(max(start, lowerStart / 1e6), min(stop, lowerEnd / 1e6)),
+                   (max(start, upperStart / 1e6), min(stop, upperEnd / 1e6))]
+
+        return freqs[mask], levels[mask], windows
+
+    def add(self, start, stop, freqCentre, data, offset, bandwidth, average,
+            alertLevel=None, replace=False):
+        self.queue.put((start, stop, freqCentre, data, offset, bandwidth,
+                        average, alertLevel, replace))
+
+    def get_queue_depth(self):
+        return self.queue.qsize()
+
+    def stop(self):
+        self.queue.put(None)
 
 
 if __name__ == '__main__':
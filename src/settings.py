@@ -25,10 +25,18 @@
 
 import wx
 
-from constants import Display, Mode, PlotFunc
+from constants import Backpressure, Display, Mode, PlotFunc, SAMPLE_RATE
 from devices import DeviceRTL, format_device_rtl_name, DeviceGPS
 
 
+class Segment(object):
+    def __init__(self, start, stop, dwell, nfft):
+        self.start = start
+        self.stop = stop
+        self.dwell = dwell
+        self.nfft = nfft
+
+
 class Settings(object):
     def __init__(self, load=True):
         self.cfg = None
@@ -48,6 +56,8 @@ class Settings(object):
 
         self.retainScans = True
         self.retainMax = 20
+        self.retainByMemory = False
+        self.retainMemory = 256
         self.fadeScans = True
         self.lineWidth = 0.4
         self.colourMapUse = True
@@ -78,6 +88,12 @@ class Settings(object):
         self.scanDelay = 0
         self.overlap = 0.0
         self.winFunc = "Hamming"
+        self.adaptive = False
+        self.adaptiveLevel = 10.0
+        self.adaptiveDwell = 0.131
+        self.adaptiveNfft = 4096
+        self.queueSize = 16
+        self.backpressure = Backpressure.BLOCK
 
         self.startOption = 0
         self.stopOption = 0
@@ -105,6 +121,8 @@ class Settings(object):
         self.devicesGps = []
         self.indexGps = 0
 
+        self.segments = []
+
         if load:
             self.__load()
 
@@ -134,6 +152,16 @@ class Settings(object):
             device.calibration = self.cfg.ReadFloat('calibration', 0)
             device.lo = self.cfg.ReadFloat('lo', 0)
             device.offset = self.cfg.ReadFloat('offset', 250e3)
+            device.sampleRate = self.cfg.ReadFloat('sampleRate', SAMPLE_RATE)
+            if device.isDevice:
+                settle = DeviceRTL.SETTLE_DEVICE
+            else:
+                settle = DeviceRTL.SETTLE_SERVER
+            device.settle = self.cfg.ReadFloat('settle', settle)
+            device.split = self.cfg.ReadBool('split', False)
+            device.agc = self.cfg.ReadBool('agc', False)
+            device.directSampling = self.cfg.ReadInt('directSampling', 0)
+            device.offsetTuning = self.cfg.ReadBool('offsetTuning', False)
             device.tuner = self.cfg.ReadInt('tuner', 0)
             self.devicesRtl.append(device)
             self.cfg.SetPath("/DevicesRTL")
@@ -176,6 +204,12 @@ class Settings(object):
                 self.cfg.WriteFloat('lo', device.lo)
                 self.cfg.WriteFloat('calibration', device.calibration)
                 self.cfg.WriteFloat('offset', device.offset)
+                self.cfg.WriteFloat('sampleRate', device.sampleRate)
+                self.cfg.WriteFloat('settle', device.settle)
+                self.cfg.WriteBool('split', device.split)
+                self.cfg.WriteBool('agc', device.agc)
+                self.cfg.WriteInt('directSampling', device.directSampling)
+                self.cfg.WriteBool('offsetTuning', device.offsetTuning)
                 self.cfg.WriteInt('tuner', device.tuner)
 
     def __save_devices_gps(self):
@@ -208,6 +242,9 @@ class Settings(object):
         self.fadeScans = self.cfg.ReadBool('fadeScans', self.fadeScans)
         self.lineWidth = self.cfg.ReadFloat('lineWidth', self.lineWidth)
         self.retainMax = self.cfg.ReadInt('retainMax', self.retainMax)
+        self.retainByMemory = self.cfg.ReadBool('retainByMemory',
+                                                self.retainByMemory)
+        self.retainMemory = self.cfg.ReadInt('retainMemory', self.retainMemory)
         self.colourMapUse = self.cfg.ReadBool('colourMapUse', self.colourMapUse)
         self.colourMap = self.cfg.Read('colourMap', self.colourMap)
         self.background = self.cfg.Read('background', self.background)
@@ -232,6 +269,14 @@ class Settings(object):
         self.scanDelay = self.cfg.ReadInt('scanDelay', self.scanDelay)
         self.overlap = self.cfg.ReadFloat('overlap', self.overlap)
         self.winFunc = self.cfg.Read('winFunc', self.winFunc)
+        self.adaptive = self.cfg.ReadBool('adaptive', self.adaptive)
+        self.adaptiveLevel = self.cfg.ReadFloat('adaptiveLevel',
+                                                self.adaptiveLevel)
+        self.adaptiveDwell = self.cfg.ReadFloat('adaptiveDwell',
+                                                self.adaptiveDwell)
+        self.adaptiveNfft = self.cfg.ReadInt('adaptiveNfft', self.adaptiveNfft)
+        self.queueSize = self.cfg.ReadInt('queueSize', self.queueSize)
+        self.backpressure = self.cfg.ReadInt('backpressure', self.backpressure)
         self.startOption = self.cfg.ReadInt('startOption', self.startOption)
         self.stopOption = self.cfg.ReadInt('stopOption', self.stopOption)
         self.liveUpdate = self.cfg.ReadBool('liveUpdate', self.liveUpdate)
@@ -252,6 +297,7 @@ class Settings(object):
         self.indexGps = self.cfg.ReadInt('indexGps', self.indexGps)
         self.__load_devices_rtl()
         self.__load_devices_gps()
+        self.__load_segments()
 
     def save(self):
         self.cfg.SetPath("/")
@@ -268,6 +314,8 @@ class Settings(object):
         self.cfg.WriteBool('fadeScans', self.fadeScans)
         self.cfg.WriteFloat('lineWidth', self.lineWidth)
         self.cfg.WriteInt('retainMax', self.retainMax)
+        self.cfg.WriteBool('retainByMemory', self.retainByMemory)
+        self.cfg.WriteInt('retainMemory', self.retainMemory)
         self.cfg.WriteBool('colourMapUse', self.colourMapUse)
         self.cfg.Write('colourMap', self.colourMap)
         self.cfg.Write('background', self.background)
@@ -292,6 +340,12 @@ class Settings(object):
         self.cfg.WriteInt('scanDelay', self.scanDelay)
         self.cfg.WriteFloat('overlap', self.overlap)
         self.cfg.Write("winFunc", self.winFunc)
+        self.cfg.WriteBool('adaptive', self.adaptive)
+        self.cfg.WriteFloat('adaptiveLevel', self.adaptiveLevel)
+        self.cfg.WriteFloat('adaptiveDwell', self.adaptiveDwell)
+        self.cfg.WriteInt('adaptiveNfft', self.adaptiveNfft)
+        self.cfg.WriteInt('queueSize', self.queueSize)
+        self.cfg.WriteInt('backpressure', self.backpressure)
         self.cfg.WriteInt('startOption', self.startOption)
         self.cfg.WriteInt('stopOption', self.stopOption)
         self.cfg.WriteBool('liveUpdate', self.liveUpdate)
@@ -311,6 +365,7 @@ class Settings(object):
         self.cfg.WriteInt('indexGps', self.indexGps)
         self.__save_devices_rtl()
         self.__save_devices_gps()
+        self.__save_segments()
 
         self.cfg.DeleteEntry('autoScale')
         self.cfg.DeleteEntry('yMax')
@@ -318,6 +373,38 @@ class Settings(object):
         self.cfg.DeleteEntry('average')
         self.cfg.DeleteEntry('index')
 
+    def __load_segments(self):
+        self.segments = []
+        self.cfg.SetPath("/Segments")
+        group = self.cfg.GetFirstGroup()
+        while group[0]:
+            self.cfg.SetPath("/Segments/" + group[1])
+            segment = Segment(self.cfg.ReadFloat('start', self.start),
+                              self.cfg.ReadFloat('stop', self.stop),
+                              self.cfg.ReadFloat('dwell', self.dwell),
+                              self.cfg.ReadInt('nfft', self.nfft))
+            self.segments.append(segment)
+            self.cfg.SetPath("/Segments")
+            group = self.cfg.GetNextGroup(group[2])
+        self.segments.sort(key=lambda s: s.start)
+
+    def __save_segments(self):
+        self.cfg.DeleteGroup("/Segments")
+        for i in range(len(self.segments)):
+            segment = self.segments[i]
+            self.cfg.SetPath("/Segments/{:03d}".format(i))
+            self.cfg.WriteFloat('start', segment.start)
+            self.cfg.WriteFloat('stop', segment.stop)
+            self.cfg.WriteFloat('dwell', segment.dwell)
+            self.cfg.WriteInt('nfft', segment.nfft)
+        self.cfg.SetPath("/")
+
+    def get_segments(self, isCal=False):
+        if self.segments and not isCal:
+            return self.segments
+
+        return [Segment(self.start, self.stop, self.dwell, self.nfft)]
+
     def reset(self):
         self.cfg.SetPath("/")
         self.cfg.DeleteAll()
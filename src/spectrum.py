@@ -23,8 +23,8 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
 from collections import OrderedDict
-from decimal import Decimal
-from operator import itemgetter, mul
+from operator import itemgetter
+import weakref
 
 from matplotlib.dates import seconds
 import numpy
@@ -34,6 +34,636 @@ from misc import db_to_level, level_to_db
 from utils_mpl import utc_to_mpl
 
 
+class SpectrumStore(object):
+    ROWS_INIT = 8
+
+    def __init__(self, spectrum=None):
+        self.clear()
+        if spectrum is not None:
+            self.update(spectrum)
+
+    def __len__(self):
+        return self.sweeps
+
+    def __iter__(self):
+        return iter(self.get_timestamps().tolist())
+
+    def __contains__(self, timeStamp):
+        return self.__find_row(timeStamp) is not None
+
+    def __getitem__(self, timeStamp):
+        row = self.__find_row(timeStamp)
+        if row is None:
+            raise KeyError(timeStamp)
+        return SweepView(self, timeStamp)
+
+    def __setitem__(self, timeStamp, sweep):
+        row = self.__find_row(timeStamp)
+        if row is None:
+            row = self.__add_row(timeStamp)
+            if row is None:
+                return
+        else:
+            self.__preserve(row)
+            self.levels[row].fill(numpy.nan)
+            self.stale = True
+        if len(sweep):
+            freqs, levels = split_spectrum(sweep)
+            self.set_levels(timeStamp, freqs, levels)
+
+    def __delitem__(self, timeStamp):
+        row = self.__find_row(timeStamp)
+        if row is None:
+            raise KeyError(timeStamp)
+        if row == self.first:
+            self.__evict()
+            return
+        self.__linearise()
+        row = self.__find_row(timeStamp)
+        self.__preserve(*range(row, self.sweeps))
+        self.timeStamps[row:self.sweeps - 1] = self.timeStamps[row + 1:self.sweeps]
+        self.levels[row:self.sweeps - 1] = self.levels[row + 1:self.sweeps]
+        self.sweeps -= 1
+        self.stale = True
+
+    def __getstate__(self):
+        return {'freqs': self.freqs,
+                'timeStamps': self.get_timestamps(),
+                'levels': self.get_levels()}
+
+    def __setstate__(self, state):
+        self.freqs = state['freqs']
+        self.timeStamps = state['timeStamps']
+        self.levels = state['levels']
+        self.sweeps = len(self.timeStamps)
+        self.first = 0
+        self.capacity = None
+        self.memory = None
+        self.stale = True
+        self.snapshots = []
+
+    def __is_wrapped(self):
+        return self.first + self.sweeps > len(self.timeStamps)
+
+    def __find_row(self, timeStamp):
+        rows = len(self.timeStamps)
+        end = self.first + self.sweeps
+        if end > rows and timeStamp >= self.timeStamps[0]:
+            offset = 0
+            end -= rows
+        else:
+            offset = self.first
+            end = min(end, rows)
+        timeStamps = self.timeStamps[offset:end]
+        row = numpy.searchsorted(timeStamps, timeStamp)
+        if row < len(timeStamps) and timeStamps[row] == timeStamp:
+            return offset + row
+        return None
+
+    def __find_cols(self, freqs):
+        freqs = numpy.asarray(freqs, dtype=numpy.float64)
+        cols = self.find_cols(freqs)
+        if cols is None:
+            self.__add_freqs(freqs)
+            cols = numpy.searchsorted(self.freqs, freqs)
+
+        return cols
+
+    def __add_row(self, timeStamp):
+        capacity = self.get_capacity()
+        if capacity is not None:
+            if (self.sweeps >= capacity and
+                    timeStamp < self.timeStamps[self.first]):
+                return None
+            while self.sweeps >= capacity:
+                self.__evict()
+
+        rows = self.levels.shape[0]
+        if self.sweeps == rows:
+            rows = max(rows * 2, self.ROWS_INIT)
+            if capacity is not None:
+                rows = max(min(rows, capacity), self.sweeps + 1)
+            self.__resize(rows)
+
+        rows = self.levels.shape[0]
+        if self.sweeps == 0 or timeStamp > self.timeStamps[self.__last()]:
+            row = (self.first + self.sweeps) % rows
+            self.__preserve(row)
+        else:
+            self.__linearise()
+            row = numpy.searchsorted(self.timeStamps[:self.sweeps], timeStamp)
+            self.__preserve(*range(row, self.sweeps + 1))
+            self.timeStamps[row + 1:self.sweeps + 1] = self.timeStamps[row:self.sweeps]
+            self.levels[row + 1:self.sweeps + 1] = self.levels[row:self.sweeps]
+        self.timeStamps[row] = timeStamp
+        self.levels[row].fill(numpy.nan)
+        self.sweeps += 1
+        if row == self.__last():
+            self.fPeak = None
+            self.lPeak = float('-inf')
+
+        return row
+
+    def __last(self):
+        return (self.first + self.sweeps - 1) % len(self.timeStamps)
+
+    def __evict(self):
+        self.first = (self.first + 1) % len(self.timeStamps)
+        self.sweeps -= 1
+        if self.sweeps == 0:
+            self.first = 0
+        self.stale = True
+
+    def __resize(self, rows):
+        timeStamps = numpy.empty(rows, numpy.float64)
+        timeStamps[:self.sweeps] = self.get_timestamps()
+        levels = numpy.empty((rows, len(self.freqs)), numpy.float32)
+        levels[:self.sweeps] = self.get_levels()
+        self.timeStamps = timeStamps
+        self.levels = levels
+        self.first = 0
+
+    def __linearise(self):
+        if self.first != 0:
+            self.__resize(len(self.timeStamps))
+
+    def __add_freqs(self, freqs):
+        self.__linearise()
+        axis = numpy.union1d(self.freqs, freqs)
+        levels = numpy.empty((self.levels.shape[0], len(axis)),
+                             numpy.float32)
+        levels.fill(numpy.nan)
+        cols = numpy.searchsorted(axis, self.freqs)
+        levels[:self.sweeps, cols] = self.levels[:self.sweeps]
+        self.freqs = axis
+        self.levels = levels
+
+    def __preserve(self, *rows):
+        for ref in self.snapshots[:]:
+            snapshot = ref()
+            if snapshot is not None and snapshot.levels is self.levels:
+                snapshot.preserve(rows)
+
+    def __get_snapshot_size(self):
+        size = 0
+        for ref in self.snapshots[:]:
+            snapshot = ref()
+            if snapshot is not None:
+                size += snapshot.get_size(self.levels)
+
+        return size
+
+    def __track(self, row, cols, levels, current):
+        if self.stale or not len(cols):
+            return
+        if numpy.isnan(levels).any():
+            self.stale = True
+            return
+
+        existing = ~numpy.isnan(current)
+        if existing.any():
+            replaced = current[existing]
+            if replaced.min() <= self.lMin or replaced.max() >= self.lMax:
+                self.stale = True
+                return
+
+        self.fMin = min(self.fMin, float(self.freqs[cols.min()]))
+        self.fMax = max(self.fMax, float(self.freqs[cols.max()]))
+        self.lMin = min(self.lMin, float(levels.min()))
+        self.lMax = max(self.lMax, float(levels.max()))
+
+        if row != self.__last():
+            return
+        if self.fPeak is not None and existing.any():
+            if self.fPeak in self.freqs[cols[existing]]:
+                self.stale = True
+                return
+        col = levels.argmax()
+        if levels[col] > self.lPeak:
+            self.fPeak = float(self.freqs[cols[col]])
+            self.lPeak = float(levels[col])
+
+    def __calc_extent(self):
+        self.__clear_extent()
+        self.stale = False
+        if self.sweeps == 0:
+            return
+
+        levels = self.get_levels()
+        valid = ~numpy.isnan(levels)
+        cols = numpy.flatnonzero(valid.any(axis=0))
+        if len(cols):
+            self.fMin = float(self.freqs[cols[0]])
+            self.fMax = float(self.freqs[cols[-1]])
+            self.lMin = float(numpy.nanmin(levels))
+            self.lMax = float(numpy.nanmax(levels))
+        if valid[-1].any():
+            col = numpy.nanargmax(levels[-1])
+            self.fPeak = float(self.freqs[col])
+            self.lPeak = float(levels[-1, col])
+
+    def __clear_extent(self):
+        self.fMin = float('inf')
+        self.fMax = float('-inf')
+        self.lMin = float('inf')
+        self.lMax = float('-inf')
+        self.fPeak = None
+        self.lPeak = float('-inf')
+
+    def clear(self):
+        self.freqs = numpy.empty(0, numpy.float64)
+        self.timeStamps = numpy.empty(0, numpy.float64)
+        self.levels = numpy.empty((0, 0), numpy.float32)
+        self.sweeps = 0
+        self.first = 0
+        self.capacity = None
+        self.memory = None
+        self.__clear_extent()
+        self.stale = False
+        self.snapshots = []
+
+    def set_capacity(self, sweeps=None, memory=None):
+        self.capacity = sweeps
+        self.memory = memory
+        capacity = self.get_capacity()
+        if capacity is not None:
+            while self.sweeps > capacity:
+                self.__evict()
+
+    def get_capacity(self):
+        if self.memory is not None:
+            used = self.freqs.nbytes + self.__get_snapshot_size()
+            return max(1, int((self.memory - used) /
+                              (len(self.freqs) * 4 + 8)))
+        return self.capacity
+
+    def update(self, spectrum):
+        for timeStamp, sweep in spectrum.items():
+            self[timeStamp] = sweep
+
+    def keys(self):
+        return list(self)
+
+    def values(self):
+        return [SweepView(self, timeStamp) for timeStamp in self]
+
+    def items(self):
+        return [(timeStamp, SweepView(self, timeStamp)) for timeStamp in self]
+
+    def iterkeys(self):
+        return iter(self)
+
+    def itervalues(self):
+        return iter(self.values())
+
+    def iteritems(self):
+        return iter(self.items())
+
+    def get(self, timeStamp, default=None):
+        if timeStamp in self:
+            return self[timeStamp]
+        return default
+
+    def get_freqs(self):
+        return self.freqs
+
+    def get_timestamps(self):
+        if self.__is_wrapped():
+            return numpy.concatenate((self.timeStamps[self.first:],
+                                      self.timeStamps[:self.__last() + 1]))
+        return self.timeStamps[self.first:self.first + self.sweeps]
+
+    def get_levels(self):
+        if self.__is_wrapped():
+            return numpy.concatenate((self.levels[self.first:],
+                                      self.levels[:self.__last() + 1]))
+        return self.levels[self.first:self.first + self.sweeps]
+
+    def get_extent(self):
+        if self.stale:
+            self.__calc_extent()
+        if self.fPeak is None:
+            return self.fMin, self.fMax, self.lMin, self.lMax, None, None
+        return (self.fMin, self.fMax, self.lMin, self.lMax,
+                self.fPeak, self.lPeak)
+
+    def get_oldest(self):
+        if self.sweeps == 0:
+            return None
+        return self.timeStamps[self.first]
+
+    def get_newest(self):
+        if self.sweeps == 0:
+            return None
+        return self.timeStamps[self.__last()]
+
+    def get_row(self, timeStamp):
+        return self.__find_row(timeStamp)
+
+    def find_cols(self, freqs):
+        if len(self.freqs) == 0:
+            return None
+        cols = numpy.searchsorted(self.freqs, freqs)
+        cols = numpy.minimum(cols, len(self.freqs) - 1)
+        if not numpy.array_equal(self.freqs[cols], freqs):
+            return None
+
+        return cols
+
+    def get_sweep(self, timeStamp):
+        row = self.__find_row(timeStamp)
+        if row is None:
+            raise KeyError(timeStamp)
+        levels = self.levels[row]
+        mask = ~numpy.isnan(levels)
+        return self.freqs[mask], levels[mask]
+
+    def get_level(self, timeStamp, freq):
+        row = self.__find_row(timeStamp)
+        cols = self.find_cols([freq])
+        if row is None or cols is None:
+            return None
+        level = self.levels[row, cols[0]]
+        if numpy.isnan(level):
+            return None
+
+        return float(level)
+
+    def count_sweep(self, timeStamp):
+        row = self.__find_row(timeStamp)
+        if row is None:
+            return 0
+        return numpy.count_nonzero(~numpy.isnan(self.levels[row]))
+
+    def snapshot(self):
+        snapshot = SpectrumSnapshot(self.freqs, self.get_timestamps().copy(),
+                                    self.levels, self.first,
+                                    self.get_extent())
+        self.snapshots = [ref for ref in self.snapshots
+                          if ref() is not None]
+        self.snapshots.append(weakref.ref(snapshot))
+
+        return snapshot
+
+    def set_levels(self, timeStamp, freqs, levels):
+        if self.__find_row(timeStamp) is None:
+            if self.__add_row(timeStamp) is None:
+                return
+        cols = self.__find_cols(freqs)
+        row = self.__find_row(timeStamp)
+        levels = numpy.asarray(levels, dtype=numpy.float32)
+        self.__preserve(row)
+        self.__track(row, cols, levels, self.levels[row, cols])
+        self.levels[row, cols] = levels
+
+    def clear_levels(self, timeStamp, start, stop):
+        row = self.__find_row(timeStamp)
+        if row is not None:
+            cols = (start <= self.freqs) & (self.freqs <= stop)
+            self.__preserve(row)
+            self.levels[row, cols] = numpy.nan
+            self.stale = True
+
+    def merge_levels(self, timeStamp, freqs, levels):
+        if self.__find_row(timeStamp) is None:
+            if self.__add_row(timeStamp) is None:
+                return None, None
+        cols = self.__find_cols(freqs)
+        row = self.__find_row(timeStamp)
+        current = self.levels[row, cols]
+        existing = ~numpy.isnan(current)
+        merged = numpy.where(existing, (current + levels) / 2, levels)
+        self.__preserve(row)
+        self.__track(row, cols, merged.astype(numpy.float32), current)
+        self.levels[row, cols] = merged
+
+        return merged, existing
+
+    def count_points(self):
+        return numpy.count_nonzero(~numpy.isnan(self.get_levels()))
+
+    def as_dict(self):
+        spectrum = OrderedDict()
+        for timeStamp in self:
+            freqs, levels = self.get_sweep(timeStamp)
+            spectrum[timeStamp] = OrderedDict(zip(freqs.tolist(),
+                                                  levels.tolist()))
+
+        return spectrum
+
+
+class SpectrumSnapshot(object):
+    def __init__(self, freqs, timeStamps, levels, first, extent):
+        self.freqs = freqs
+        self.timeStamps = timeStamps
+        self.levels = levels
+        self.first = first
+        self.extent = extent
+        self.saved = {}
+
+    def __len__(self):
+        return len(self.timeStamps)
+
+    def __iter__(self):
+        return iter(self.timeStamps[::-1].tolist())
+
+    def __contains__(self, timeStamp):
+        return self.get_row(timeStamp) is not None
+
+    def __getitem__(self, timeStamp):
+        if timeStamp not in self:
+            raise KeyError(timeStamp)
+        return SweepView(self, timeStamp)
+
+    def __copy__(self):
+        return self
+
+    def __is_row(self, row):
+        return (row - self.first) % len(self.levels) < len(self.timeStamps)
+
+    def __rows(self):
+        rows = xrange(self.first, self.first + len(self.timeStamps))
+        return [row % len(self.levels) for row in rows]
+
+    def __read(self, row, function):
+        levels = self.saved.get(row)
+        if levels is not None:
+            return function(levels)
+        result = function(self.levels[row])
+        levels = self.saved.get(row)
+        if levels is not None:
+            return function(levels)
+        return result
+
+    def __split(self, levels):
+        mask = ~numpy.isnan(levels)
+        return self.freqs[mask], levels[mask]
+
+    def get_size(self, levels):
+        size = self.timeStamps.nbytes
+        if self.levels is not levels:
+            return size + self.levels.nbytes
+        for row in self.saved.values():
+            size += row.nbytes
+
+        return size
+
+    def preserve(self, rows):
+        for row in rows:
+            if row not in self.saved and self.__is_row(row):
+                levels = self.levels[row].copy()
+                levels.flags.writeable = False
+                self.saved[row] = levels
+
+    def keys(self):
+        return list(self)
+
+    def values(self):
+        return [SweepView(self, timeStamp) for timeStamp in self]
+
+    def items(self):
+        return [(timeStamp, SweepView(self, timeStamp)) for timeStamp in self]
+
+    def iterkeys(self):
+        return iter(self)
+
+    def itervalues(self):
+        return iter(self.values())
+
+    def iteritems(self):
+        return iter(self.items())
+
+    def get(self, timeStamp, default=None):
+        if timeStamp in self:
+            return self[timeStamp]
+        return default
+
+    def get_freqs(self):
+        return self.freqs
+
+    def get_timestamps(self):
+        return self.timeStamps
+
+    def get_levels(self):
+        if not len(self.timeStamps):
+            return numpy.empty((0, len(self.freqs)), numpy.float32)
+        return numpy.vstack([self.__read(row, numpy.array)
+                             for row in self.__rows()])
+
+    def get_extent(self):
+        return self.extent
+
+    def get_oldest(self):
+        if not len(self.timeStamps):
+            return None
+        return self.timeStamps[0]
+
+    def get_newest(self):
+        if not len(self.timeStamps):
+            return None
+        return self.timeStamps[-1]
+
+    def get_row(self, timeStamp):
+        row = numpy.searchsorted(self.timeStamps, timeStamp)
+        if row < len(self.timeStamps) and self.timeStamps[row] == timeStamp:
+            return (self.first + row) % len(self.levels)
+        return None
+
+    def find_cols(self, freqs):
+        if len(self.freqs) == 0:
+            return None
+        cols = numpy.searchsorted(self.freqs, freqs)
+        cols = numpy.minimum(cols, len(self.freqs) - 1)
+        if not numpy.array_equal(self.freqs[cols], freqs):
+            return None
+
+        return cols
+
+    def get_sweep(self, timeStamp):
+        row = self.get_row(timeStamp)
+        if row is None:
+            raise KeyError(timeStamp)
+        return self.__read(row, self.__split)
+
+    def get_level(self, timeStamp, freq):
+        row = self.get_row(timeStamp)
+        cols = self.find_cols([freq])
+        if row is None or cols is None:
+            return None
+        level = self.__read(row, lambda levels: float(levels[cols[0]]))
+        if numpy.isnan(level):
+            return None
+
+        return level
+
+    def count_sweep(self, timeStamp):
+        row = self.get_row(timeStamp)
+        if row is None:
+            return 0
+        return self.__read(row, count_levels)
+
+    def count_points(self):
+        return sum([self.__read(row, count_levels) for row in self.__rows()])
+
+
+class SweepView(object):
+    def __init__(self, store, timeStamp):
+        self.store = store
+        self.timeStamp = timeStamp
+
+    def __arrays(self):
+        return self.store.get_sweep(self.timeStamp)
+
+    def __level(self, freq):
+        return self.store.get_level(self.timeStamp, freq)
+
+    def __len__(self):
+        return self.store.count_sweep(self.timeStamp)
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __contains__(self, freq):
+        return self.__level(freq) is not None
+
+    def __getitem__(self, freq):
+        level = self.__level(freq)
+        if level is None:
+            raise KeyError(freq)
+        return level
+
+    def __setitem__(self, freq, level):
+        self.store.set_levels(self.timeStamp, [freq], [level])
+
+    def keys(self):
+        return self.__arrays()[0].tolist()
+
+    def values(self):
+        return self.__arrays()[1].tolist()
+
+    def items(self):
+        freqs, levels = self.__arrays()
+        return zip(freqs.tolist(), levels.tolist())
+
+    def iterkeys(self):
+        return iter(self.keys())
+
+    def itervalues(self):
+        return iter(self.values())
+
+    def iteritems(self):
+        return iter(self.items())
+
+    def get(self, freq, default=None):
+        try:
+            return self[freq]
+        except KeyError:
+            return default
+
+    def copy(self):
+        return OrderedDict(self.items())
+
+
 class Extent(object):
     def __init__(self, spectrum):
         self.__clear()
@@ -46,11 +676,16 @@ class Extent(object):
         self.lMax = float('-inf')
         self.tMin = float('inf')
         self.tMax = float('-inf')
+        self.tStep = 1
         self.fPeak = None
         self.lPeak = None
         self.tPeak = None
 
     def __calc_extent(self, spectrum):
+        if isinstance(spectrum, (SpectrumStore, SpectrumSnapshot)):
+            self.__calc_extent_store(spectrum)
+            return
+
         for timeStamp in spectrum:
             points = spectrum[timeStamp].items()
             if len(points) > 0:
@@ -64,11 +699,24 @@ class Extent(object):
                 self.lMax = max(self.lMax, lMax)
         self.tMin = min(spectrum)
         self.tMax = max(spectrum)
+        self.tStep = calc_sweep_interval(self.tMin, self.tMax, len(spectrum))
         self.tPeak = self.tMax
         if len(spectrum[self.tMax]) > 0:
             self.fPeak, self.lPeak = max(spectrum[self.tMax].items(),
                                          key=lambda(_f, l): l)
 
+    def __calc_extent_store(self, spectrum):
+        (self.fMin, self.fMax,
+         self.lMin, self.lMax,
+         self.fPeak, self.lPeak) = spectrum.get_extent()
+        self.tMin = float(spectrum.get_oldest())
+        self.tMax = float(spectrum.get_newest())
+        self.tStep = calc_sweep_interval(self.tMin, self.tMax, len(spectrum))
+        self.tPeak = self.tMax
+
+    def is_valid(self):
+        return self.lMin <= self.lMax
+
     def get_f(self):
         if self.fMin == self.fMax:
             return self.fMin, self.fMax - 0.001
@@ -80,7 +728,7 @@ class Extent(object):
         return self.lMin, self.lMax
 
     def get_t(self):
-        return utc_to_mpl(self.tMax), utc_to_mpl(self.tMin - 1)
+        return utc_to_mpl(self.tMax), utc_to_mpl(self.tMin - self.tStep)
 
     def get_ft(self):
         tExtent = self.get_t()
@@ -112,63 +760,39 @@ class Measure(object):
 
     def __calculate(self, spectrum, start, end):
         sweep = slice_spectrum(spectrum, start, end)
-        if sweep is None or len(sweep) == 0:
+        if sweep is None or len(sweep[0]) == 0:
             return
 
-        self.minF = min(sweep)[0]
-        self.maxF = max(sweep)[0]
-        self.minP = min(sweep, key=lambda v: v[1])
-        self.maxP = max(sweep, key=lambda v: v[1])
+        freqs = sweep[0]
+        levels = sweep[1].astype(numpy.float64)
 
-        powers = [Decimal(db_to_level(p[1])) for p in sweep]
-        length = len(powers)
+        self.minF = float(freqs[0])
+        self.maxF = float(freqs[-1])
+        index = levels.argmin()
+        self.minP = (float(freqs[index]), float(levels[index]))
+        index = levels.argmax()
+        self.maxP = (float(freqs[index]), float(levels[index]))
 
-        avg = sum(powers, Decimal(0)) / length
+        avg = numpy.mean(10 ** (levels / 10.0))
         self.avgP = level_to_db(avg)
+        self.gMeanP = float(levels.mean())
+        self.flatness = db_to_level(self.gMeanP - self.avgP)
 
-        product = reduce(mul, iter(powers))
-        gMean = product ** (Decimal(1.0) / length)
-        self.gMeanP = level_to_db(gMean)
-
-        self.flatness = gMean / avg
-
-        self.__calc_hbw(sweep)
-        self.__calc_obw(sweep)
+        self.hbw = self.__calc_bw(freqs, levels, self.maxP[1] - 3)
+        self.obw = self.__calc_bw(freqs, levels, float(levels.sum()) * 0.005)
 
         self.isValid = True
 
-    def __calc_hbw(self, sweep):
-        power = self.maxP[1] - 3
-        self.hbw = [None, None, power]
+    def __calc_bw(self, freqs, levels, power):
+        bw = [None, None, power]
 
         if power >= self.minP[1]:
-            for (f, p) in sweep:
-                if p >= power:
-                    self.hbw[0] = f
-                    break
-            for (f, p) in reversed(sweep):
-                if p >= power:
-                    self.hbw[1] = f
-                    break
-
-    def __calc_obw(self, sweep):
-        self.obw = [None, None, None]
-
-        totalP = 0
-        for (_f, p) in sweep:
-            totalP += p
-        power = totalP * 0.005
-        self.obw[2] = power
+            indices = numpy.flatnonzero(levels >= power)
+            if len(indices):
+                bw[0] = float(freqs[indices[0]])
+                bw[1] = float(freqs[indices[-1]])
 
-        if power >= self.minP[1]:
-            for (f, p) in sweep:
-                if p >= power:
-                    self.obw[0] = f
-                    break
-            for (f, p) in reversed(sweep):
-                if p >= power:
-                    self.obw[1] = f
-                    break
+        return bw
 
     def is_valid(self):
         return self.isValid
@@ -198,7 +822,14 @@ class Measure(object):
         return self.obw
 
 
+def count_levels(levels):
+    return numpy.count_nonzero(~numpy.isnan(levels))
+
+
 def count_points(spectrum):
+    if isinstance(spectrum, (SpectrumStore, SpectrumSnapshot)):
+        return spectrum.count_points()
+
     points = 0
     for timeStamp in spectrum:
         points += len(spectrum[timeStamp])
@@ -206,35 +837,51 @@ def count_points(spectrum):
     return points
 
 
-def reduce_points(spectrum, limit):
+def reduce_points(spectrum, limit, pixels, extent):
     total = count_points(spectrum)
     if total < limit:
         return spectrum
 
     newSpectrum = OrderedDict()
-    ratio = float(total) / limit
+    columns = max(1, min(pixels, limit / (2 * len(spectrum))))
+    fMin, fMax = extent.get_f()
     for timeStamp in spectrum:
-        points = spectrum[timeStamp].items()
-        reduced = OrderedDict()
-        for i in xrange(int(len(points) / ratio)):
-            point = points[int(i * ratio):int((i + 1) * ratio)][0]
-            reduced[point[0]] = point[1]
-        newSpectrum[timeStamp] = reduced
+        freqs, levels = get_sweep_arrays(spectrum, timeStamp)
+        freqs, levels = reduce_sweep(freqs, levels, columns, fMin, fMax)
+        newSpectrum[timeStamp] = OrderedDict(zip(freqs.tolist(),
+                                                 levels.tolist()))
 
     return newSpectrum
 
 
+def reduce_sweep(freqs, levels, columns, fMin, fMax):
+    if len(levels) <= columns * 2:
+        return freqs, levels
+
+    buckets = numpy.floor((freqs - fMin) * columns / (fMax - fMin))
+    buckets = numpy.clip(buckets, 0, columns - 1)
+    order = numpy.lexsort((levels, buckets))
+    sortedBuckets = buckets[order]
+    firsts = numpy.flatnonzero(numpy.append(True, sortedBuckets[1:] !=
+                                            sortedBuckets[:-1]))
+    lasts = numpy.append(firsts[1:], len(order)) - 1
+    indices = numpy.unique(numpy.append(order[firsts], order[lasts]))
+
+    return freqs[indices], levels[indices]
+
+
 def split_spectrum(spectrum):
-    freqs = spectrum.keys()
-    powers = map(spectrum.get, freqs)
+    points = spectrum.items()
+    freqs = [point[0] for point in points]
+    powers = [point[1] for point in points]
 
     return freqs, powers
 
 
 def split_spectrum_sort(spectrum):
-    freqs = spectrum.keys()
-    freqs.sort()
-    powers = map(spectrum.get, freqs)
+    points = sorted(spectrum.items())
+    freqs = [point[0] for point in points]
+    powers = [point[1] for point in points]
 
     return freqs, powers
 
@@ -243,22 +890,39 @@ def slice_spectrum(spectrum, start, end):
     if spectrum is None or start is None or end is None or len(spectrum) < 1:
         return None
 
-    sweep = spectrum[max(spectrum)]
-    if len(sweep) == 0:
+    freqs, levels = get_sweep_arrays(spectrum, max(spectrum))
+    if len(freqs) == 0:
         return None
 
-    if min(sweep) > start or max(sweep) < end:
+    if freqs[0] > start or freqs[-1] < end:
         length = len(spectrum)
         if length > 1:
-            sweep = spectrum.values()[length - 2]
+            timeStamp = spectrum.keys()[length - 2]
+            freqs, levels = get_sweep_arrays(spectrum, timeStamp)
         else:
             return None
 
-    sweepTemp = {}
-    for f, p in sweep.iteritems():
-        if start <= f <= end:
-            sweepTemp[f] = p
-    return sorted(sweepTemp.items(), key=lambda t: t[0])
+    mask = (start <= freqs) & (freqs <= end)
+    return freqs[mask], levels[mask]
+
+
+def get_sweep_arrays(spectrum, timeStamp):
+    if isinstance(spectrum, (SpectrumStore, SpectrumSnapshot)):
+        return spectrum.get_sweep(timeStamp)
+
+    sweep = spectrum[timeStamp]
+    freqs = numpy.array(sweep.keys(), dtype=numpy.float64)
+    levels = numpy.array(sweep.values(), dtype=numpy.float64)
+    order = freqs.argsort()
+
+    return freqs[order], levels[order]
+
+
+def calc_sweep_interval(tMin, tMax, sweeps):
+    if sweeps < 2:
+        return 1
+
+    return (tMax - tMin) / (sweeps - 1)
 
 
 def create_mesh(spectrum, mplTime):
@@ -278,17 +942,23 @@ def create_mesh(spectrum, mplTime):
             z[i, j] = zs[i]
         j += 1
 
+    interval = calc_sweep_interval(min(spectrum), max(spectrum), total)
     x[:, 0] = x[:, 1]
     if mplTime:
-        y[:, 0] = y[:, 1] - seconds(1)
+        y[:, 0] = y[:, 1] - seconds(interval)
     else:
-        y[:, 0] = y[:, 1] - 1
+        y[:, 0] = y[:, 1] - interval
     z[:, 0] = z[:, 1]
 
     return x, y, z
 
 
 def sort_spectrum(spectrum):
+    if isinstance(spectrum, SpectrumStore):
+        return spectrum.snapshot()
+    if isinstance(spectrum, SpectrumSnapshot):
+        return spectrum
+
     newSpectrum = OrderedDict()
     for timeStamp in reversed(sorted(spectrum)):
         newPoints = OrderedDict()
@@ -336,7 +1006,7 @@ def smooth_sweep(sweep, winFunc, ratio):
 
 
 def get_peaks(spectrum, threshold):
-    sweep = OrderedDict(spectrum[max(spectrum)])
+    sweep = OrderedDict(spectrum[max(spectrum)].items())
     for freq, level in sweep.items():
         if level < threshold:
             del sweep[freq]
@@ -24,7 +24,6 @@
 #
 import datetime
 import math
-import time
 
 from PIL import ImageDraw, ImageFilter, Image, ImageChops
 from matplotlib import cm
@@ -80,8 +79,7 @@ def set_table_colour(table, colour):
 
 
 def utc_to_mpl(utc):
-    local = time.mktime(time.localtime(utc))
-    dt = datetime.datetime.fromtimestamp(local)
+    dt = datetime.datetime.fromtimestamp(utc)
     return date2num(dt)
 
 